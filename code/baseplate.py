@@ -1,7 +1,76 @@
+import copy
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
 import numpy as np
-import matplotlib.pyplot as plt
-from transistor import Transistor
-plt.rc('font', size=30)
+from transistor import WIDTH, LENGTH, RTH
+from device_table import DeviceTable
+from kernel_cache import KernelCache, default_cache
+import disk_cache
+from footprint_stats import FootprintStats
+from results import DeviceResult, FieldResult
+from coupling import ThermalCoupling
+import telemetry
+
+THREAD_BLOCK = 4     # terms summed per task of the thread pool, fixed so that the sums do not depend on the thread count
+
+def fft_convolve(a,b):
+    # full linear 2D convolution of a and b
+    shape = (a.shape[0]+b.shape[0]-1, a.shape[1]+b.shape[1]-1)
+    return np.fft.irfft2(np.fft.rfft2(a,shape)*np.fft.rfft2(b,shape),shape)
+
+class FootprintField:
+    # Stand-in for the temperature matrix which only evaluates the rectangles it is sliced with,
+    # e.g. T[x_low:x_up, z_low:z_up] in Transistor.estimate_case_temperature. Slices follow
+    # numpy semantics on the full (view_x*nump, view_z*nump) grid and are cached. Regions are
+    # evaluated on a snapshot of the baseplate, so like a full matrix the field keeps the state
+    # it was solved for when the baseplate is changed afterwards. There is no full matrix to plot.
+
+    def __init__(self,baseplate,num_mirror_sources):
+        self.baseplate = baseplate.snapshot()
+        self.num_mirror_sources = num_mirror_sources
+        self.shape = (int(baseplate.view_x*baseplate.nump), int(baseplate.view_z*baseplate.nump))
+        self.regions = {}
+
+    def __getitem__(self,index):
+        if not (isinstance(index,tuple) and len(index) == 2 and all(isinstance(i,slice) for i in index)):
+            raise TypeError("FootprintField only supports slicing with two slices")
+        x_start,x_stop,x_step = index[0].indices(self.shape[0])
+        z_start,z_stop,z_step = index[1].indices(self.shape[1])
+        if x_step != 1 or z_step != 1:
+            raise TypeError("FootprintField only supports contiguous slices")
+
+        x_stop = max(x_stop,x_start)
+        z_stop = max(z_stop,z_start)
+        key = (x_start,x_stop,z_start,z_stop)
+        if key not in self.regions:
+            self.regions[key] = self.baseplate.calculate_temperature_region(x_start,x_stop,z_start,z_stop,self.num_mirror_sources)
+        return self.regions[key]
+
+class CompositeField(FootprintField):
+    # Two resolution field: the footprints of all transistors on the fine grid (baseplate.nump),
+    # slicable like FootprintField so case temperatures equal those of a uniform fine grid, and
+    # the whole view on the coarse grid of coarse_nump points/mm for contour plots.
+
+    def __init__(self,baseplate,num_mirror_sources,coarse_nump):
+        FootprintField.__init__(self,baseplate,num_mirror_sources)
+        baseplate = self.baseplate
+        for transistor in baseplate.transistor_array:
+            x_start,x_stop,z_start,z_stop = baseplate.footprint_region(transistor)
+            self[x_start:x_stop,z_start:z_stop]
+
+        # the coarse field takes the order the adaptive series reached on the footprints
+        if num_mirror_sources is None:
+            num_mirror_sources = baseplate.mirror_order
+        self.coarse_nump = coarse_nump
+        np_x = int(baseplate.view_x*coarse_nump)
+        np_z = int(baseplate.view_z*coarse_nump)
+        self.coarse = np.zeros((np_x,np_z))
+        for transistor in baseplate.transistor_array:
+            self.coarse += baseplate.calc_transistor_field(transistor,0,np_x,0,np_z,num_mirror_sources,coarse_nump)
+
+    def points(self):
+        return self.coarse.size + sum(region.size for region in self.regions.values())
 
 class Baseplate:
     def __init__(self,thermal_conductivity,thickness,Ta):
@@ -11,9 +80,35 @@ class Baseplate:
         self.view_x = 50                     # view area in mm
         self.view_z = 50
         self.max_estimation = True
+        self.footprint_stats = False         # case temperatures of all transistors from one FootprintStats of the field
+        self.subcell = False                 # with footprint_stats: average over the exact footprint, partial cells by area
         self.Ta = Ta
+        self.solver = "direct"               # "direct": sum every transistor, "fft": convolve source map with kernels
+                                             # (exact for centres on grid points, devices across the lower plate
+                                             # edges are solved directly; off-grid centres are split over the
+                                             # neighbouring points, which is off by up to 1.0% of the peak rise anywhere
+                                             # in the field at 5 points/mm and 2.2% at 2 points/mm, case temperature
+                                             # rises by up to 0.09% and 0.34%),
+                                             # "footprint": only evaluate the field under the transistors on demand,
+                                             # "tiled": compute the field tile by tile within tile_bytes of memory,
+                                             # "composite": footprints at nump, the rest of the view at coarse_nump
+        self.kernel_cache = default_cache    # unit-power fields reused for transistors centred on grid points
+        self.disk_cache = disk_cache.active  # DiskCache keeping solved fields between runs, see disk_cache.configure
+        self.mirror_tolerance = 0.01         # K, used when num_mirror_sources is None (adaptive image series)
+        self.max_mirror_order = 100
+        self.mirror_order = None             # order reached and estimated truncation error of the last adaptive solve
+        self.mirror_error = None
+        self.coarse_nump = 1                 # points pr mm outside the footprints for the "composite" solver
+        self.threads = None                  # direct solver: spread the terms over this many threads
+        self.tile_bytes = 64*2**20           # working memory of one tile for the "tiled" solver
+        self.field_dtype = np.float64        # output type of the "tiled" solver, e.g. np.float32
+        self.field_path = None               # "tiled" solver writes the field to this .npy file (memory mapped)
+        self.incremental = False             # keep one layer per transistor and only recompute those that changed
+        self.layers = []                     # (state, power, field) per transistor from the last incremental solve
+        self.layer_setup = None
+        self.T_layers = None
 
-        self.transistor_array = []           # array of transistors placed on baseplate
+        self.transistor_array = DeviceTable()   # array of transistors placed on baseplate
 
 
     def change_view_range(self,view_x,view_z,nump):
@@ -22,58 +117,438 @@ class Baseplate:
         self.view_z = view_z
 
 
+    def snapshot(self):
+        # copy with its own device arrays and without incremental layers, later changes of this
+        # baseplate do not reach it
+        plate = copy.copy(self)
+        plate.transistor_array = self.transistor_array.copy()
+        plate.layers = []
+        plate.layer_setup = None
+        plate.T_layers = None
+        return plate
+
     def add_transistor(self,power,x0,z0):
-        self.transistor_array.append(Transistor(power,x0,z0))
+        self.transistor_array.add(power,x0,z0)
+
+    def add_transistors(self,powers,x0,z0,width=WIDTH,length=LENGTH,Rth=RTH):
+        # many transistors at once from arrays, returns their indices in transistor_array
+        return self.transistor_array.add(powers,x0,z0,width,length,Rth)
 
     def calculate_temperature_matrix(self,num_mirror_sources):
 
-        T = []
+        if self.solver == "footprint":
+            return FootprintField(self,num_mirror_sources)
+        if self.solver == "composite":
+            return CompositeField(self,num_mirror_sources,self.coarse_nump)
+        # adaptive solves are not cached, they also report the order they reached, neither are
+        # fields written to field_path
+        if self.disk_cache is None or num_mirror_sources is None or self.field_path is not None:
+            return self.compute_temperature_matrix(num_mirror_sources)
+
+        key = self.field_key(num_mirror_sources)
+        T = self.disk_cache.load(key)
+        if T is None:
+            T = self.compute_temperature_matrix(num_mirror_sources)
+            self.disk_cache.store(key,T)
+        return T
+
+    def field_key(self,num_mirror_sources):
+        # every input of the solved field
+        devices = self.transistor_array
+        return self.disk_cache.key("field",self.k,self.thickness,self.nump,self.view_x,self.view_z,num_mirror_sources,self.solver,
+                                   np.dtype(self.field_dtype).str,devices.power,devices.x0,devices.z0,devices.width,devices.length,devices.accurate)
+
+    def compute_temperature_matrix(self,num_mirror_sources):
+        if num_mirror_sources is None:
+            return self.calculate_temperature_region_adaptive(0,int(self.view_x*self.nump),0,int(self.view_z*self.nump))
+        if self.solver == "fft":
+            return self.calculate_temperature_matrix_fft(num_mirror_sources)
+        if self.solver == "tiled":
+            return self.calculate_temperature_matrix_tiled(num_mirror_sources)
+        if self.incremental:
+            return self.calculate_temperature_matrix_incremental(num_mirror_sources)
+        if self.threads is not None:
+            return self.calculate_temperature_matrix_threaded(num_mirror_sources)
+
+        T = None
 
+        tm = telemetry.active
         for transistor in self.transistor_array:
-            print("Calculate surface temperature contribution for transistor with power " + str(transistor.power) + " and position (" + str(transistor.x0) + "," + str(transistor.z0) + ")" )
-            Tmp = transistor.calc_contribution(self.nump, self.view_x, self.view_z, self.k,self.thickness,num_mirror_sources)
-            if T == []:
-                T = Tmp
-            else:
+            tm.log(telemetry.INFO,"Calculate surface temperature contribution for transistor with power %s and position (%s,%s)",transistor.power,transistor.x0,transistor.z0)
+            Tmp = self.calc_transistor_contribution(transistor,num_mirror_sources)
+            with tm.stage("aggregation"):
+                if T is None:
+                    T = Tmp
+                else:
+                    T += Tmp
+
+        return T
+
+    def calculate_temperature_region(self,x_start,x_stop,z_start,z_stop,num_mirror_sources):
+        # Field of all transistors on the grid points [x_start,x_stop) x [z_start,z_stop) only
+        if num_mirror_sources is None:
+            return self.calculate_temperature_region_adaptive(x_start,x_stop,z_start,z_stop)
+
+        T = np.zeros((x_stop-x_start, z_stop-z_start))
+        tm = telemetry.active
+        for transistor in self.transistor_array:
+            Tmp = self.calc_transistor_field(transistor,x_start,x_stop,z_start,z_stop,num_mirror_sources)
+            with tm.stage("aggregation"):
                 T += Tmp
+        return T
 
+    def calculate_temperature_region_adaptive(self,x_start,x_stop,z_start,z_stop):
+        # Adds mirror source orders until the estimate on the region changes by less than
+        # mirror_tolerance. The accurate image terms alternate in sign and shrink with depth at
+        # every point, so the mean of the last two partial sums converges much faster than the
+        # partial sums themselves. That mean is returned, and the change of it between the last two
+        # orders, (t_n + t_n-1)/2, is the stopping criterion and the reported error estimate. The
+        # fast mirror sources are all positive and fall off like 1/n, their series diverges.
+        if not all(transistor.accurate for transistor in self.transistor_array):
+            raise ValueError("The adaptive mirror source series (num_mirror_sources None) needs accurate mirror sources, "
+                             "the series of the fast ones diverges; give a fixed number of mirror sources")
+
+        tm = telemetry.active
+        T = np.zeros((x_stop-x_start, z_stop-z_start))
+        with tm.stage("direct"):
+            for transistor in self.transistor_array:
+                T += transistor.plate_field(self.nump,x_start,x_stop,z_start,z_stop,self.k)
+
+        term = np.zeros_like(T)
+        change = 0.0
+        order = 0
+        while order < self.max_mirror_order:
+            order += 1
+            last = term
+            term = np.zeros_like(T)
+            with tm.stage("mirror_%d" % order):
+                for transistor in self.transistor_array:
+                    term += transistor.mirror_order_field(self.nump,x_start,x_stop,z_start,z_stop,self.k,self.thickness,order)
+            T += term
+            change = 0.5*float(np.max(np.abs(term + last))) if term.size else 0.0
+            if change < self.mirror_tolerance:
+                break
+
+        T -= 0.5*term
+
+        self.mirror_order = order
+        self.mirror_error = change
+        tm.log(telemetry.INFO,"Mirror source series stopped at order %d, estimated error %.3g K",order,change)
         return T
 
-    def plot_contour(self,T):
+    def footprint_region(self,transistor):
+        # grid points read by transistor.estimate_case_temperature, clipped like a numpy slice
         np_x = int(self.view_x * self.nump)
         np_z = int(self.view_z * self.nump)
+        x_low,x_up,z_low,z_up = transistor.footprint_indices(self.nump)
+        x_start,x_stop,_ = slice(x_low,x_up).indices(np_x)
+        z_start,z_stop,_ = slice(z_low,z_up).indices(np_z)
+        return x_start,max(x_stop,x_start),z_start,max(z_stop,z_start)
 
-        xlist = np.linspace(0, self.view_x, np_x)
-        zlist = np.linspace(0, self.view_z, np_z)
-        X, Z = np.meshgrid(xlist, zlist)
+    def resolve_mirror_order(self,num_mirror_sources):
+        # Fixed number of mirror sources for the methods which need one. None runs the adaptive
+        # series on the footprints of all transistors and takes the highest order any of them
+        # reached, mirror_order and mirror_error are set as by an adaptive solve.
+        if num_mirror_sources is not None:
+            return num_mirror_sources
+        order = 0
+        error = 0.0
+        for transistor in self.transistor_array:
+            x_start,x_stop,z_start,z_stop = self.footprint_region(transistor)
+            if x_stop == x_start or z_stop == z_start:
+                continue
+            self.calculate_temperature_region_adaptive(x_start,x_stop,z_start,z_stop)
+            order = max(order,self.mirror_order)
+            error = max(error,self.mirror_error)
+        self.mirror_order = order
+        self.mirror_error = error
+        return order
 
-        fig,ax = plt.subplots(1,1)
+    def build_coupling(self,num_mirror_sources):
+        # Footprint responses of every transistor to 1 W in every transistor, see ThermalCoupling.
+        # With num_mirror_sources None the responses are the averaged estimates of the adaptive
+        # series at the order resolve_mirror_order finds.
+        order = self.resolve_mirror_order(num_mirror_sources)
+        responses = []
+        devices = self.transistor_array
+        powers = devices.power.copy()
+        try:
+            devices.power[:] = 1.0
+            for target in self.transistor_array:
+                x_start,x_stop,z_start,z_stop = self.footprint_region(target)
+                if x_stop == x_start or z_stop == z_start:
+                    raise ValueError("Transistor at (" + str(target.x0) + "," + str(target.z0) + ") has no grid points inside the view range")
+                response = []
+                for source in self.transistor_array:
+                    field = self.calc_transistor_field(source,x_start,x_stop,z_start,z_stop,order)
+                    if num_mirror_sources is None and order > 0:
+                        field = field - 0.5*source.mirror_order_field(self.nump,x_start,x_stop,z_start,z_stop,self.k,self.thickness,order)
+                    response.append(field.ravel())
+                responses.append(np.stack(response,axis=1))
+        finally:
+            devices.power[:] = powers
 
-        for transistor in self.transistor_array:
-            transistor.plot_base_xy(ax)
+        return ThermalCoupling(responses,self.transistor_array.Rth.copy(),powers,self.Ta)
 
-        cp = ax.contour(X,Z,T,40,cmap="inferno")
-        ax.clabel(cp, inline=True, fontsize=10)
-        #ax.set_ylim(30,80)
-        ax.set_xlabel("z [mm]")
-        ax.set_ylabel("x [mm]")
-        plt.show()
+    def calculate_temperature_components(self,num_mirror_sources):
+        # Plate and mirror source parts of the field at the current k. The plate term scales
+        # as 1/k^2 and the mirror sources as 1/k, see rescale_conductivity. Both are full fields:
+        # the "footprint" and "composite" solvers are replaced by "direct" here, and field_path is
+        # not used because the two solves would share the file.
+        solver,field_path = self.solver,self.field_path
+        if solver in ("footprint","composite"):
+            self.solver = "direct"
+        self.field_path = None
+        try:
+            T_plate = self.calculate_temperature_matrix(0)
+            T_mirror = self.calculate_temperature_matrix(num_mirror_sources) - T_plate
+        finally:
+            self.solver,self.field_path = solver,field_path
+        return T_plate,T_mirror
 
-    def plot_contourf(self,T):
+    def rescale_conductivity(self,T_plate,T_mirror,k):
+        return T_plate*(self.k/k)**2 + T_mirror*(self.k/k)
+
+    def calculate_temperature_matrix_incremental(self,num_mirror_sources):
+        # The field is linear in the transistor powers: a moved transistor swaps its layer, a
+        # transistor with a new power only rescales it. Anything changing all layers starts over.
+        setup = (self.k,self.thickness,self.nump,self.view_x,self.view_z,num_mirror_sources)
+        if setup != self.layer_setup or len(self.layers) > len(self.transistor_array):
+            self.layers = []
+            self.layer_setup = setup
+            self.T_layers = np.zeros((int(self.view_x*self.nump), int(self.view_z*self.nump)))
+
+        tm = telemetry.active
+        for i,transistor in enumerate(self.transistor_array):
+            state = (transistor.x0,transistor.z0,transistor.width,transistor.length,transistor.accurate,transistor.vectorized)
+
+            if i < len(self.layers):
+                old_state,old_power,layer = self.layers[i]
+                if state == old_state and transistor.power == old_power:
+                    continue
+                if state == old_state and old_power != 0:
+                    new_layer = layer*(transistor.power/old_power)
+                    self.T_layers += new_layer - layer
+                    self.layers[i] = (state,transistor.power,new_layer)
+                    continue
+                self.T_layers -= layer
+
+            tm.log(telemetry.INFO,"Calculate surface temperature contribution for transistor with power %s and position (%s,%s)",transistor.power,transistor.x0,transistor.z0)
+            layer = self.calc_transistor_contribution(transistor,num_mirror_sources)
+            with tm.stage("aggregation"):
+                self.T_layers += layer
+            if i < len(self.layers):
+                self.layers[i] = (state,transistor.power,layer)
+            else:
+                self.layers.append((state,transistor.power,layer))
+
+        return self.T_layers.copy()
+
+    def calculate_temperature_matrix_threaded(self,num_mirror_sources):
+        # Every (transistor, order) term is one task, order 0 is the plate and 1..ms the mirror
+        # sources, transistors without the vectorized kernels are one task. Consecutive blocks of
+        # THREAD_BLOCK tasks are summed in the threads and the block sums in block order, so the
+        # result is identical for every number of threads. The terms are computed on the view
+        # directly, the kernel cache is not used.
         np_x = int(self.view_x * self.nump)
         np_z = int(self.view_z * self.nump)
 
-        xlist = np.linspace(0, self.view_x, np_x)
-        zlist = np.linspace(0, self.view_z, np_z)
-        X, Z = np.meshgrid(xlist, zlist)
+        tasks = []
+        for transistor in self.transistor_array:
+            if transistor.vectorized:
+                tasks.extend((transistor,order) for order in range(num_mirror_sources+1))
+            else:
+                tasks.append((transistor,None))
+        blocks = [tasks[i:i+THREAD_BLOCK] for i in range(0,len(tasks),THREAD_BLOCK)]
+
+        tm = telemetry.active
+        T = np.zeros((np_x,np_z))
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            for i,block in enumerate(pool.map(partial(self.sum_terms,np_x,np_z,num_mirror_sources),blocks)):
+                with tm.stage("aggregation"):
+                    T += block
+                tm.progress("terms",min(len(tasks),(i+1)*THREAD_BLOCK),len(tasks))
+        return T
+
+    def sum_terms(self,np_x,np_z,num_mirror_sources,tasks):
+        T = np.zeros((np_x,np_z))
+        tm = telemetry.active
+        for transistor,order in tasks:
+            if order is None:
+                T += transistor.calc_contribution(self.nump,self.view_x,self.view_z,self.k,self.thickness,num_mirror_sources)
+            elif order == 0:
+                with tm.stage("direct"):
+                    T += transistor.plate_field(self.nump,0,np_x,0,np_z,self.k)
+            else:
+                with tm.stage("mirror_%d" % order):
+                    T += transistor.mirror_order_field(self.nump,0,np_x,0,np_z,self.k,self.thickness,order)
+        return T
+
+    def calculate_temperature_matrix_tiled(self,num_mirror_sources):
+        # Peak memory is the output buffer plus one tile, independent of the plate size. Tiles are
+        # summed in float64 and written once, the kernel cache is bypassed since its kernels are
+        # four times the size of the view.
+        np_x = int(self.view_x * self.nump)
+        np_z = int(self.view_z * self.nump)
 
-        fig, ax = plt.subplots(1, 1)
+        if self.field_path is not None:
+            T = np.lib.format.open_memmap(self.field_path,mode="w+",dtype=self.field_dtype,shape=(np_x,np_z))
+        else:
+            T = np.empty((np_x,np_z),dtype=self.field_dtype)
 
+        # the mirror kernels of a tile extend by the footprint size, roughly 12 float64 arrays of
+        # that size are alive at the same time
+        margin_x = 1
+        margin_z = 1
         for transistor in self.transistor_array:
-            transistor.plot_base_xy(ax)
+            x_low,x_up,z_low,z_up = transistor.footprint_indices(self.nump)
+            margin_x = max(margin_x,x_up-x_low)
+            margin_z = max(margin_z,z_up-z_low)
+        points = max(1,self.tile_bytes//(12*8))
+        side = int(np.sqrt(points))
+        tile_x = min(np_x,max(1,side-margin_x))
+        tile_z = min(np_z,max(1,points//(tile_x+margin_x)-margin_z))
+
+        tm = telemetry.active
+        tiles = ((np_x+tile_x-1)//tile_x)*((np_z+tile_z-1)//tile_z)
+        done = 0
+        for x_start in range(0,np_x,tile_x):
+            x_stop = min(np_x,x_start+tile_x)
+            for z_start in range(0,np_z,tile_z):
+                z_stop = min(np_z,z_start+tile_z)
+                tile = np.zeros((x_stop-x_start,z_stop-z_start))
+                for transistor in self.transistor_array:
+                    Tmp = transistor.calc_field(self.nump,x_start,x_stop,z_start,z_stop,self.k,self.thickness,num_mirror_sources)
+                    with tm.stage("aggregation"):
+                        tile += Tmp
+                    del Tmp
+                T[x_start:x_stop,z_start:z_stop] = tile
+                done += 1
+                tm.progress("tiles",done,tiles)
+
+        if isinstance(T,np.memmap):
+            T.flush()
+        return T
+
+    def calculate_temperature_matrix_fft(self,num_mirror_sources):
+        np_x = int(self.view_x * self.nump)
+        np_z = int(self.view_z * self.nump)
+
+        T = np.zeros((np_x, np_z))
+
+        # one kernel and one convolution per package type. Footprints crossing the lower plate edges
+        # are cut by the direct solve in a way no shifted kernel reproduces, those devices are
+        # solved directly, as in KernelCache.field.
+        devices = self.transistor_array
+        tm = telemetry.active
+        edge = (devices.x0 - devices.width*0.5 < 0) | (devices.z0 - devices.length*0.5 < 0)
+        for i in np.flatnonzero(edge):
+            T += self.calc_transistor_contribution(devices[i],num_mirror_sources)
+        for (width,length,accurate),indices in devices.packages():
+            indices = indices[~edge[indices]]
+            if len(indices) == 0:
+                continue
+            tm.log(telemetry.INFO,"FFT convolution for %d transistors of size %sx%s",len(indices),width,length)
+            S = self.rasterize_sources(devices.x0[indices],devices.z0[indices],devices.power[indices],np_x,np_z)
+            K = self.unit_kernel(width,length,accurate,num_mirror_sources)
+            half_x = (K.shape[0]-1)//2
+            half_z = (K.shape[1]-1)//2
+            with tm.stage("fft"):
+                T += fft_convolve(S,K)[half_x:half_x+np_x, half_z:half_z+np_z]
+
+        return T
 
-        ax.contourf(X, Z, T, 50,cmap="inferno")        #https://matplotlib.org/stable/tutorials/colors/colormaps.html
-        plt.show()
+    def rasterize_sources(self,x0,z0,power,np_x,np_z):
+        # Source map on the grid points 0..np_x, 0..np_z. Powers of transistors centred between grid
+        # points are split bilinearly over the four surrounding points, centres on a grid point are exact.
+        # The split smears the source by up to one grid step, see the error of the "fft" solver.
+        S = np.zeros((np_x+1, np_z+1))
+        px = x0 * self.nump
+        pz = z0 * self.nump
+        ix = np.floor(px + 1e-9).astype(int)
+        iz = np.floor(pz + 1e-9).astype(int)
+        fx = np.maximum(px - ix, 0.0)
+        fz = np.maximum(pz - iz, 0.0)
+        outside = (ix < 0) | (iz < 0) | (ix + (fx > 1e-9) > np_x) | (iz + (fz > 1e-9) > np_z)
+        if np.any(outside):
+            i = np.argmax(outside)
+            raise ValueError("Transistor at (" + str(x0[i]) + "," + str(z0[i]) + ") is outside the view range")
+        # weights of points which are not needed are zero and land inside the padded map
+        np.add.at(S,(ix,iz),power*(1-fx)*(1-fz))
+        np.add.at(S,(np.minimum(ix+1,np_x),iz),np.where(fx > 1e-9,power*fx*(1-fz),0.0))
+        np.add.at(S,(ix,np.minimum(iz+1,np_z)),np.where(fz > 1e-9,power*(1-fx)*fz,0.0))
+        np.add.at(S,(np.minimum(ix+1,np_x),np.minimum(iz+1,np_z)),np.where((fx > 1e-9) & (fz > 1e-9),power*fx*fz,0.0))
+        return S
+
+    def unit_kernel(self,width,length,accurate,num_mirror_sources):
+        # Field of a 1 W transistor for every offset between two points of the view, built in a
+        # throwaway cache when kernel_cache is None
+        np_x = int(self.view_x * self.nump)
+        np_z = int(self.view_z * self.nump)
+        cache = self.kernel_cache if self.kernel_cache is not None else KernelCache()
+        return cache.unit_field(width,length,accurate,self.thickness,num_mirror_sources,self.nump,self.k,np_x,np_z)
+
+    def calc_transistor_field(self,transistor,x_start,x_stop,z_start,z_stop,num_mirror_sources,nump=None):
+        # grid points of the view at nump points/mm (default self.nump)
+        nump = self.nump if nump is None else nump
+        if self.kernel_cache is not None:
+            np_x = int(self.view_x * nump)
+            np_z = int(self.view_z * nump)
+            T = self.kernel_cache.field(transistor,nump,x_start,x_stop,z_start,z_stop,self.k,self.thickness,num_mirror_sources,np_x,np_z)
+            if T is not None:
+                return T
+        return transistor.calc_field(nump,x_start,x_stop,z_start,z_stop,self.k,self.thickness,num_mirror_sources)
+
+    def calc_transistor_contribution(self,transistor,num_mirror_sources):
+        if self.kernel_cache is not None and transistor.vectorized:
+            T = self.kernel_cache.contribution(transistor,self.nump,self.view_x,self.view_z,self.k,self.thickness,num_mirror_sources)
+            if T is not None:
+                return T
+        return transistor.calc_contribution(self.nump,self.view_x,self.view_z,self.k,self.thickness,num_mirror_sources)
+
+    def solve(self,num_mirror_sources):
+        return self.field_result(self.calculate_temperature_matrix(num_mirror_sources))
+
+    def statistics(self,T):
+        # FootprintStats of T when footprint_stats is on and T is a full field, otherwise None
+        if not self.footprint_stats or not isinstance(T,np.ndarray):
+            return None
+        with telemetry.active.stage("footprint_stats"):
+            return FootprintStats(T)
+
+    def case_temperatures(self,T,max_point,stats=None):
+        # case temperature increase of every transistor, stats from self.statistics(T) if given
+        if stats is None:
+            return np.array([transistor.estimate_case_temperature(T,self.nump,max_point) for transistor in self.transistor_array])
+
+        devices = self.transistor_array
+        with telemetry.active.stage("case_temperature"):
+            if max_point:
+                return stats.maximum(*devices.footprint_indices(self.nump))
+            if self.subcell:
+                return stats.average((devices.x0 - devices.width*0.5)*self.nump,(devices.x0 + devices.width*0.5)*self.nump,
+                                     (devices.z0 - devices.length*0.5)*self.nump,(devices.z0 + devices.length*0.5)*self.nump)
+            return stats.average(*devices.footprint_indices(self.nump))
+
+    def field_result(self,T):
+        # a composite field is plotted on its coarse grid, the devices are evaluated on the fine one
+        devices = []
+        stats = self.statistics(T)
+        tc_avgs = self.case_temperatures(T,False,stats)
+        tc_maxs = self.case_temperatures(T,True,stats)
+        for transistor,tc_avg,tc_max in zip(self.transistor_array,tc_avgs,tc_maxs):
+            devices.append(DeviceResult(transistor.x0,transistor.z0,transistor.width,transistor.length,transistor.power,tc_avg,tc_max,self.Ta,transistor.Rth))
+        if isinstance(T,CompositeField):
+            return FieldResult(T.coarse,self.view_x,self.view_z,T.coarse_nump,self.Ta,devices)
+        return FieldResult(T,self.view_x,self.view_z,self.nump,self.Ta,devices)
+
+    def plot_contour(self,T):
+        import plotting
+        plotting.show(self.field_result(T))
+
+    def plot_contourf(self,T):
+        import plotting
+        plotting.show(self.field_result(T),filled=True)
 
     def print_junction_temp(self):
 
@@ -81,8 +556,8 @@ class Baseplate:
         result = []
         print("\n=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-")
         print("Estimate junction temperature for transistor on baseplate")
-        for transistor in self.transistor_array:
-            temp = transistor.estimate_case_temperature(T,self.nump,self.max_estimation)
+        temps = self.case_temperatures(T,self.max_estimation,self.statistics(T))
+        for transistor,temp in zip(self.transistor_array,temps):
             result.append(temp)
             print("\t" + str(transistor.power) + "W transistor at (" + str(transistor.x0) + "," + str(transistor.z0) + "):\t\t" '%.4f' % temp)
         print("=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-")
@@ -92,14 +567,18 @@ class Baseplate:
         pos = transistor_num-1
         self.transistor_array[pos].set_position(new_x0,new_z0)
 
+    def update_power(self,transistor_num,new_power):
+        pos = transistor_num-1
+        self.transistor_array[pos].power = new_power
+
     def print_transistor_stat(self,T):
         print("\n=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-")
         print("|Position\t|Power\t|Temperature increase (average / max)\t|Case temperature (average / max)" )
-        for transistor in self.transistor_array:
+        stats = self.statistics(T)
+        tmp_maxs = self.case_temperatures(T,False,stats)
+        tmp_avgs = self.case_temperatures(T,True,stats)
+        for transistor,tmp_max,tmp_avg in zip(self.transistor_array,tmp_maxs,tmp_avgs):
             position = '%.1f' % transistor.x0 + "," + '%.1f' % transistor.z0
 
-            tmp_max = transistor.estimate_case_temperature(T,self.nump,False)
-            tmp_avg = transistor.estimate_case_temperature(T,self.nump,True)
-
             print(position + "\t|" + str(transistor.power) + "\t|" + '%.2f' % tmp_max + " / " + '%.2f' % tmp_avg + "\t\t\t\t\t\t\t|" + '%.2f' % (tmp_max + self.Ta) + " / " + '%.2f' % (tmp_avg + self.Ta))
         print("=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-")
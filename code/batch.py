@@ -0,0 +1,231 @@
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+import telemetry
+from baseplate import Baseplate, FootprintField
+from sweep import parameter_grid
+
+# Batch runs of many layouts from a JSON or CSV spec file. Every solved case is appended as one
+# JSON line to the output file as soon as it is done, and cases already solved in the output
+# are skipped, so an interrupted run is resumed by starting it again with the same arguments.
+# A case which fails is written as {"id", "error"} and the batch goes on, it is tried again on restart.
+#
+# JSON spec: a list of cases or {"cases": [...]}. A case holds the parameters below (missing ones
+# take DEFAULTS), a "devices" list of {"power", "x0", "z0"} with optional "width", "length", "Rth"
+# and "rotated", and optionally a "sweep" of parameter lists, e.g. {"thickness": [5, 10, 15]},
+# which expands the case into one case per combination with the id "<id>/thickness=5".
+#
+# CSV spec: one row per device with a "case" column for the case id, the device columns and
+# optionally parameter columns, which are taken from the first row of each case.
+
+DEFAULTS = {"k": 238, "thickness": 10, "Ta": 25, "nump": 5, "ms": 1, "view_x": 50, "view_z": 50,
+            "solver": "direct", "max_point": True}
+DEVICE_COLUMNS = ("power","x0","z0","width","length","Rth","rotated")
+
+def parse_value(text):
+    # CSV cells: numbers, true/false, none/empty as None, anything else stays a string
+    text = text.strip()
+    if text == "" or text.lower() == "none":
+        return None
+    if text.lower() in ("true","false"):
+        return text.lower() == "true"
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+def read_csv(f):
+    cases = {}
+    for row in csv.DictReader(f):
+        case_id = row.pop("case").strip()     # ids as written, "001" stays "001"
+        row = {name: parse_value(value) for name,value in row.items()}
+        if case_id not in cases:
+            cases[case_id] = {name: value for name,value in row.items() if name not in DEVICE_COLUMNS and value is not None}
+            cases[case_id]["id"] = case_id
+            cases[case_id]["devices"] = []
+        cases[case_id]["devices"].append({name: row[name] for name in DEVICE_COLUMNS if row.get(name) is not None})
+    return list(cases.values())
+
+def expand_case(case):
+    # a case with a "sweep" becomes one case per point of the parameter grid
+    sweep = case.get("sweep")
+    if not sweep:
+        return [case]
+    cases = []
+    for param in parameter_grid(**sweep):
+        point = {name: value for name,value in case.items() if name != "sweep"}
+        point.update(param)
+        point["id"] = str(case["id"]) + "/" + ",".join(name + "=" + str(value) for name,value in param.items())
+        cases.append(point)
+    return cases
+
+def load_cases(path):
+    with open(path,newline="") as f:
+        if path.lower().endswith(".csv"):
+            cases = read_csv(f)
+        else:
+            cases = json.load(f)
+    return parse_cases(cases)
+
+def parse_cases(cases):
+    # cases as in a JSON spec: ids filled in, sweeps expanded
+    if isinstance(cases,dict):
+        cases = cases["cases"] if "cases" in cases else [cases]
+
+    expanded = []
+    for i,case in enumerate(cases):
+        case = dict(case)
+        case.setdefault("id",str(i))
+        if not case.get("devices"):
+            raise ValueError("Case " + str(case["id"]) + " has no devices")
+        expanded.extend(expand_case(case))
+
+    ids = [case["id"] for case in expanded]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Case ids are not unique")
+    return expanded
+
+def case_parameters(case):
+    return {name: case.get(name,default) for name,default in DEFAULTS.items()}
+
+def build_baseplate(case):
+    p = case_parameters(case)
+    baseplate = Baseplate(p["k"],p["thickness"],p["Ta"])
+    baseplate.change_view_range(p["view_x"],p["view_z"],p["nump"])
+    baseplate.solver = p["solver"]
+    baseplate.max_estimation = p["max_point"]
+    for device in case["devices"]:
+        index = baseplate.add_transistors(device["power"],device["x0"],device["z0"],
+                                          **{name: device[name] for name in ("width","length","Rth") if name in device})
+        if device.get("rotated"):
+            baseplate.transistor_array.rotate(index)
+    return baseplate
+
+def device_records(result):
+    # the columns of Baseplate.print_transistor_stat, temperatures at full precision
+    return [{"position": '%.1f' % device.x0 + "," + '%.1f' % device.z0, "power": device.power,
+             "increase_avg": device.tc_avg, "increase_max": device.tc_max,
+             "case_avg": device.tc_avg + result.Ta, "case_max": device.tc_max + result.Ta,
+             "junction_avg": device.tj_avg, "junction_max": device.tj_max}
+            for device in result.devices]
+
+def field_file(field_dir,case_id):
+    return os.path.join(field_dir,re.sub(r"[^A-Za-z0-9_.=,-]","_",case_id) + ".npz")
+
+def solve_case(case,field_dir=None):
+    start = time.perf_counter()
+    baseplate = build_baseplate(case)
+    p = case_parameters(case)
+    T = baseplate.calculate_temperature_matrix(p["ms"])
+    result = baseplate.field_result(T)
+
+    record = {"id": case["id"], "params": p, "devices": device_records(result), "field": None}
+    # footprint fields are solved on their own snapshot of the baseplate
+    solved = T.baseplate if isinstance(T,FootprintField) else baseplate
+    if solved.mirror_order is not None:
+        record["mirror_order"] = solved.mirror_order
+        record["mirror_error"] = solved.mirror_error
+
+    # a footprint solve has no field, a composite one stores its coarse grid
+    if field_dir is not None and isinstance(result.T,np.ndarray):
+        path = field_file(field_dir,case["id"])
+        np.savez_compressed(path,T=np.asarray(result.T),nump=result.nump,view_x=result.view_x,view_z=result.view_z,Ta=result.Ta)
+        record["field"] = path
+
+    record["seconds"] = time.perf_counter() - start
+    return record
+
+def run_case(case,field_dir=None):
+    # solve_case, a failing case gives an error record instead of ending the batch
+    start = time.perf_counter()
+    try:
+        return solve_case(case,field_dir)
+    except Exception as e:
+        return {"id": case["id"], "error": type(e).__name__ + ": " + str(e), "seconds": time.perf_counter() - start}
+
+def completed_ids(output_path):
+    # ids of the cases solved in output_path, error records do not count; a line cut off by an
+    # interrupted run is removed
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    valid = 0
+    with open(output_path,"rb") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                case_id = record["id"]
+            except (ValueError,KeyError,TypeError):
+                break
+            if "error" not in record:
+                done.add(case_id)
+            if not line.endswith(b"\n"):
+                break
+            valid += len(line)
+    if valid != os.path.getsize(output_path):
+        with open(output_path,"r+b") as f:
+            f.truncate(valid)
+    return done
+
+def run_batch(spec_path,output_path,field_dir=None,workers=1):
+    # returns the number of cases solved in this run
+    cases = load_cases(spec_path)
+    done = completed_ids(output_path)
+    todo = [case for case in cases if case["id"] not in done]
+    if field_dir is not None:
+        os.makedirs(field_dir,exist_ok=True)
+
+    tm = telemetry.active
+    tm.log(telemetry.INFO,"Batch %s: %d cases, %d done, %d to solve",spec_path,len(cases),len(cases)-len(todo),len(todo))
+
+    task = partial(run_case,field_dir=field_dir)
+    workers = os.cpu_count() if workers is None else workers
+    with open(output_path,"a") as out:
+        if workers > 1 and len(todo) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                records = pool.map(task,todo)
+                write_records(out,records,len(todo))
+        else:
+            write_records(out,map(task,todo),len(todo))
+    return len(todo)
+
+def write_records(out,records,total):
+    tm = telemetry.active
+    for i,record in enumerate(records):
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+        os.fsync(out.fileno())
+        if "error" in record:
+            tm.log(telemetry.INFO,"Case %s failed: %s",record["id"],record["error"])
+        else:
+            tm.log(telemetry.INFO,"Case %s solved in %.2f s",record["id"],record["seconds"])
+        tm.progress("batch",i+1,total)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve the layouts of a JSON or CSV spec file")
+    parser.add_argument("spec", help="JSON or CSV file with the cases")
+    parser.add_argument("output", help="JSON lines file the results are appended to, completed cases are skipped")
+    parser.add_argument("--fields", default=None, help="directory for the temperature fields as compressed .npz")
+    parser.add_argument("--workers", type=int, default=1, help="processes, 0 for one per core")
+    parser.add_argument("--quiet", action="store_true", help="no progress messages")
+    args = parser.parse_args(argv)
+
+    telemetry.configure(level=telemetry.SILENT if args.quiet else telemetry.INFO)
+    run_batch(args.spec,args.output,args.fields,args.workers or None)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
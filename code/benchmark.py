@@ -0,0 +1,171 @@
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import telemetry
+from baseplate import Baseplate
+from kernel_cache import KernelCache
+from transistor import Transistor
+
+# Solver speed benchmarks. Every record is one JSON line with the wall time (best of --repeat),
+# the peak traced memory, the evaluated grid points per second and, where a point-by-point loop
+# reference exists, the relative deviation from it. The loop references are evaluated on a small
+# view with at most CHECK_NPMM points/mm and CHECK_TRANSISTORS transistors, since the loops
+# themselves are far too slow for the benchmark sizes; the check setup is part of the record.
+
+K = 238
+THICKNESS = 10
+TA = 25
+CHECK_VIEW = 12             # mm, view used for the comparison with the loop implementation
+CHECK_NPMM = 2
+CHECK_TRANSISTORS = 4
+TOLERANCE = 1e-9            # max deviation from the loop reference relative to the peak value
+
+def measure(function,repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best,elapsed)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best,peak,result
+
+def relative_error(T,T_ref):
+    return float(np.max(np.abs(T - T_ref)) / np.max(np.abs(T_ref)))
+
+def record(name,params,wall,peak,points,check=None):
+    entry = {"benchmark": name, "params": params, "wall_s": wall, "peak_bytes": peak,
+             "points": points, "points_per_s": points/wall if wall > 0 else None}
+    if check is not None:
+        entry["check"],entry["max_rel_error"] = check
+        entry["accurate"] = entry["max_rel_error"] <= TOLERANCE
+    return entry
+
+def centred_transistor(view,accurate=True,vectorized=True):
+    transistor = Transistor(25,view*0.5,view*0.5)
+    transistor.accurate = accurate
+    transistor.vectorized = vectorized
+    return transistor
+
+def bench_plate(npmms,views,repeat):
+    for nump in npmms:
+        check_nump = min(nump,CHECK_NPMM)
+        reference = centred_transistor(CHECK_VIEW,vectorized=False)
+        fast = centred_transistor(CHECK_VIEW)
+        error = relative_error(fast.calc_plate_contribution(check_nump,CHECK_VIEW,CHECK_VIEW,K),
+                               reference.calc_plate_contribution(check_nump,CHECK_VIEW,CHECK_VIEW,K))
+        check = ({"npmm": check_nump, "view": CHECK_VIEW},error)
+        for view in views:
+            transistor = centred_transistor(view)
+            wall,peak,T = measure(lambda: transistor.calc_plate_contribution(nump,view,view,K),repeat)
+            yield record("plate",{"npmm": nump, "view": view},wall,peak,T.size,check)
+
+def bench_mirror(npmms,views,orders,repeat):
+    for accurate in (True,False):
+        path = "mirror_accurate" if accurate else "mirror_fast"
+        for nump in npmms:
+            for ms in orders:
+                check_nump = min(nump,CHECK_NPMM)
+                reference = centred_transistor(CHECK_VIEW,accurate,vectorized=False)
+                fast = centred_transistor(CHECK_VIEW,accurate)
+                error = relative_error(fast.calc_mirror_source_contribution(check_nump,CHECK_VIEW,CHECK_VIEW,K,THICKNESS,ms),
+                                       reference.calc_mirror_source_contribution(check_nump,CHECK_VIEW,CHECK_VIEW,K,THICKNESS,ms))
+                check = ({"npmm": check_nump, "view": CHECK_VIEW, "ms": ms},error)
+                for view in views:
+                    transistor = centred_transistor(view,accurate)
+                    wall,peak,T = measure(lambda: transistor.calc_mirror_source_contribution(nump,view,view,K,THICKNESS,ms),repeat)
+                    yield record(path,{"npmm": nump, "view": view, "ms": ms},wall,peak,T.size,check)
+
+def grid_layout(view,count,nump,solver,cached,vectorized=True):
+    baseplate = Baseplate(K,THICKNESS,TA)
+    baseplate.change_view_range(view,view,nump)
+    baseplate.solver = solver
+    baseplate.kernel_cache = KernelCache() if cached else None
+
+    # devices on a square grid, centres on grid points
+    side = int(np.ceil(np.sqrt(count)))
+    positions = np.round(np.linspace(8,view-8,side)*nump)/nump
+    for i in range(count):
+        baseplate.add_transistor(10,positions[i//side],positions[i%side])
+        baseplate.transistor_array[-1].vectorized = vectorized
+    return baseplate
+
+def bench_matrix(npmms,views,counts,orders,repeat):
+    for solver,cached in (("direct",False),("direct",True),("fft",True)):
+        name = "matrix_" + solver + ("_cached" if cached and solver == "direct" else "")
+        for nump in npmms:
+            for ms in orders:
+                for count in counts:
+                    check_nump = min(nump,CHECK_NPMM)
+                    check_count = min(count,CHECK_TRANSISTORS)
+                    check_view = CHECK_VIEW + 8*int(np.ceil(np.sqrt(check_count)))
+                    reference = grid_layout(check_view,check_count,check_nump,"direct",False,vectorized=False)
+                    fast = grid_layout(check_view,check_count,check_nump,solver,cached)
+                    error = relative_error(fast.calculate_temperature_matrix(ms),reference.calculate_temperature_matrix(ms))
+                    check = ({"npmm": check_nump, "view": check_view, "ms": ms, "transistors": check_count},error)
+                    for view in views:
+                        baseplate = grid_layout(view,count,nump,solver,cached)
+                        # the first solve fills the kernel cache, the timed solves measure warm runs
+                        baseplate.calculate_temperature_matrix(ms)
+                        wall,peak,T = measure(lambda: baseplate.calculate_temperature_matrix(ms),repeat)
+                        yield record(name,{"npmm": nump, "view": view, "ms": ms, "transistors": count},wall,peak,T.size*count,check)
+
+def bench_case_temperature(npmms,repeat):
+    view = 20
+    for nump in npmms:
+        baseplate = grid_layout(view,1,nump,"direct",False)
+        T = baseplate.calculate_temperature_matrix(1)
+        transistor = baseplate.transistor_array[0]
+        for max_point in (True,False):
+            wall,peak,temp = measure(lambda: transistor.estimate_case_temperature(T,nump,max_point),repeat)
+            x_low,x_up,z_low,z_up = transistor.footprint_indices(nump)
+            yield record("case_temperature",{"npmm": nump, "view": view, "max_point": max_point},wall,peak,(x_up-x_low)*(z_up-z_low))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Transistor and Baseplate solve paths")
+    parser.add_argument("--quick", action="store_true", help="small parameter set for a fast check")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per point, the best is reported")
+    parser.add_argument("--only", nargs="*", default=None, help="run only these benchmarks (plate mirror matrix case)")
+    parser.add_argument("--output", default=None, help="write the JSON lines to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    telemetry.configure(level=telemetry.SILENT)
+
+    if args.quick:
+        npmms, views, orders, counts = [1,3], [30], [1], [1,4]
+        case_npmms = [1,5,15]
+    else:
+        npmms, views, orders, counts = [1,3,5,10], [25,50,95], [1,2,3], [1,4,16,64]
+        case_npmms = list(range(1,16))
+
+    benchmarks = {"plate": lambda: bench_plate(npmms,views,args.repeat),
+                  "mirror": lambda: bench_mirror(npmms,views,orders,args.repeat),
+                  "matrix": lambda: bench_matrix(npmms[:2] if not args.quick else npmms,views,counts,orders[:2],args.repeat),
+                  "case": lambda: bench_case_temperature(case_npmms,args.repeat)}
+
+    out = open(args.output,"w") if args.output else sys.stdout
+    failed = 0
+    try:
+        for name in (args.only or benchmarks):
+            for entry in benchmarks[name]():
+                failed += entry.get("accurate",True) is False
+                out.write(json.dumps(entry) + "\n")
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+import numpy as np
+
+class ThermalCoupling:
+    # Linear model of a fixed placement. responses[i] holds the temperature rise on every grid point
+    # under transistor i per watt in each transistor, shape (points, N). The average rule reduces to
+    # the N x N matrix R (rise of i per watt in j); the max rule is not linear in the powers and is
+    # evaluated as the max over the points of responses[i] @ powers, which is still one matrix
+    # product per transistor. Powers are given as a vector (N,) or a batch (B, N).
+
+    def __init__(self,responses,Rth,powers,Ta):
+        self.responses = responses
+        self.R = np.array([response.mean(axis=0) for response in responses])
+        self.Rth = np.asarray(Rth,dtype=float)
+        self.powers = np.asarray(powers,dtype=float)     # powers the placement was built with
+        self.Ta = Ta
+
+    def case_temperature(self,powers,max_point):
+        powers = np.asarray(powers,dtype=float)
+        if not max_point:
+            return powers @ self.R.T
+        batch = np.atleast_2d(powers)
+        T = np.stack([(response @ batch.T).max(axis=0) for response in self.responses],axis=-1)
+        return T if powers.ndim > 1 else T[0]
+
+    def junction_temperature(self,powers,max_point):
+        powers = np.asarray(powers,dtype=float)
+        return self.case_temperature(powers,max_point) + self.Ta + self.Rth*powers
+
+    def linear_matrix(self,max_point,powers=None):
+        # N x N matrix for linear models. For the max rule every transistor is represented by the
+        # grid point which is hottest under the given (default: the placement's) powers.
+        if not max_point:
+            return self.R
+        powers = self.powers if powers is None else np.asarray(powers,dtype=float)
+        return np.array([response[np.argmax(response @ powers)] for response in self.responses])
@@ -0,0 +1,107 @@
+import numpy as np
+
+from transistor import Transistor, WIDTH, LENGTH, RTH
+
+class Device(Transistor):
+    # Row of a DeviceTable with the Transistor interface, attributes read and write the table arrays
+    def __init__(self,table,index):
+        self.table = table
+        self.index = index
+
+    def change_direction(self):
+        self.table.rotate([self.index])
+
+def column(name,cast):
+    def get(self):
+        return cast(getattr(self.table,name)[self.index])
+    def set(self,value):
+        getattr(self.table,name)[self.index] = value
+    return property(get,set)
+
+for name in ("power","x0","z0","width","length","Rth"):
+    setattr(Device,name,column(name,float))
+for name in ("rotated","accurate","vectorized"):
+    setattr(Device,name,column(name,bool))
+
+class DeviceTable:
+    # Transistors on a baseplate as one array per attribute. Indexing and iteration give Device
+    # rows, so code written for a list of Transistor objects keeps working, while the bulk methods
+    # and the solvers work on the arrays. width and length are the current x and z sizes, rotated
+    # marks devices turned with change_direction.
+
+    FLOATS = ("power","x0","z0","width","length","Rth")
+    FLAGS = ("rotated","accurate","vectorized")
+
+    def __init__(self):
+        for name in self.FLOATS:
+            setattr(self,name,np.zeros(0))
+        for name in self.FLAGS:
+            setattr(self,name,np.zeros(0,dtype=bool))
+
+    def __len__(self):
+        return len(self.power)
+
+    def __getitem__(self,index):
+        if isinstance(index,slice):
+            return [Device(self,i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("device index out of range")
+        return Device(self,index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield Device(self,i)
+
+    def add(self,power,x0,z0,width=WIDTH,length=LENGTH,Rth=RTH,accurate=True,vectorized=True):
+        # one device or, with array arguments, many at once; returns the indices of the new rows
+        power,x0,z0,width,length,Rth,accurate,vectorized = np.broadcast_arrays(
+            np.atleast_1d(power),x0,z0,width,length,Rth,accurate,vectorized)
+        start = len(self)
+        for name,values in zip(self.FLOATS,(power,x0,z0,width,length,Rth)):
+            setattr(self,name,np.concatenate([getattr(self,name),np.asarray(values,dtype=float)]))
+        rotated = np.zeros(len(power),dtype=bool)
+        for name,values in zip(self.FLAGS,(rotated,accurate,vectorized)):
+            setattr(self,name,np.concatenate([getattr(self,name),np.asarray(values,dtype=bool)]))
+        return np.arange(start,len(self))
+
+    def update(self,indices,power=None,x0=None,z0=None):
+        # new powers and/or positions for the devices at indices
+        for name,values in (("power",power),("x0",x0),("z0",z0)):
+            if values is not None:
+                getattr(self,name)[indices] = values
+
+    def rotate(self,indices):
+        # turn the devices by 90 degrees, swapping width and length
+        width = self.width[indices]
+        self.width[indices] = self.length[indices]
+        self.length[indices] = width
+        self.rotated[indices] ^= True
+
+    def copy(self):
+        table = DeviceTable()
+        for name in self.FLOATS + self.FLAGS:
+            setattr(table,name,getattr(self,name).copy())
+        return table
+
+    def remove(self,indices):
+        keep = np.ones(len(self),dtype=bool)
+        keep[indices] = False
+        for name in self.FLOATS + self.FLAGS:
+            setattr(self,name,getattr(self,name)[keep])
+
+    def footprint_indices(self,nump):
+        # Transistor.footprint_indices for all devices
+        x_low = ((self.x0 - self.width*0.5)*nump).astype(int)
+        x_up  = ((self.x0 + self.width*0.5)*nump).astype(int)
+        z_low = ((self.z0 - self.length*0.5)*nump).astype(int)
+        z_up  = ((self.z0 + self.length*0.5)*nump).astype(int)
+        return x_low,x_up,z_low,z_up
+
+    def packages(self):
+        # (width, length, accurate) per package type and the indices of its devices
+        keys = np.column_stack([self.width,self.length,self.accurate])
+        types,inverse = np.unique(keys,axis=0,return_inverse=True)
+        inverse = inverse.ravel()
+        return [((width,length,bool(accurate)),np.flatnonzero(inverse == i)) for i,(width,length,accurate) in enumerate(types)]
@@ -0,0 +1,110 @@
+import hashlib
+import os
+
+import numpy as np
+
+from kernel_cache import default_cache
+
+# Bump when a change of the solvers changes the results, old entries are then never hit again
+# and age out of the cache.
+VERSION = 1
+
+class DiskCache:
+    # Content addressed store of arrays between runs. Every entry is a .npy file named after the
+    # sha256 of the inputs it was computed from, so entries never have to be invalidated. Entries
+    # are loaded memory mapped copy-on-write: callers may modify them without touching the file.
+    # When the directory grows beyond max_bytes the least recently used entries are deleted.
+
+    def __init__(self,directory,max_bytes=4*2**30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory,exist_ok=True)
+
+    def key(self,*inputs):
+        h = hashlib.sha256(("v%d" % VERSION).encode())
+        for item in inputs:
+            if isinstance(item,np.ndarray):
+                h.update((item.dtype.str + str(item.shape)).encode())
+                h.update(np.ascontiguousarray(item).tobytes())
+            else:
+                h.update(repr(item).encode())
+            h.update(b"|")
+        return h.hexdigest()
+
+    def path(self,key):
+        return os.path.join(self.directory,key + ".npy")
+
+    def load(self,key):
+        path = self.path(key)
+        try:
+            array = np.load(path,mmap_mode="c")
+            os.utime(path)                   # last use for the eviction order
+        except (FileNotFoundError,ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return array
+
+    def store(self,key,array):
+        # written under a temporary name and renamed, concurrent runs never see partial files
+        tmp = os.path.join(self.directory,"%s.%d.tmp" % (key,os.getpid()))
+        with open(tmp,"wb") as f:
+            np.save(f,np.asarray(array))
+        os.replace(tmp,self.path(key))
+        self.evict()
+
+    def entries(self):
+        # (last use, size, path) of all entries, oldest first
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npy"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime,stat.st_size,entry.path))
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _,size,_ in entries)
+        # the newest entry is always kept
+        for _,size,path in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _,_,path in self.entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        entries = self.entries()
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(entries),
+                "bytes": sum(size for _,size,_ in entries),
+                "max_bytes": self.max_bytes,
+                "hit_rate": self.hits/lookups if lookups else 0.0}
+
+# used by new baseplates and the shared kernel cache when set with configure
+active = None
+
+def configure(directory,max_bytes=4*2**30):
+    global active
+    active = DiskCache(directory,max_bytes)
+    default_cache.disk = active
+    return active
@@ -0,0 +1,75 @@
+import numpy as np
+
+def sliding_max(a,width,axis):
+    # max of `width` consecutive entries along axis, result is width-1 shorter than a. Doubling:
+    # after the step with span s every entry holds the max over s entries, spans grow 1,2,4,..
+    # and the last step only adds what is still missing, log2(width) passes in total.
+    a = np.moveaxis(a,axis,0)
+    m = a.copy()
+    span = 1
+    while span < width:
+        step = min(span,width-span)
+        m = np.maximum(m[:m.shape[0]-step],m[step:])
+        span += step
+    return np.moveaxis(m,0,axis)
+
+class FootprintStats:
+    # Footprint statistics of one temperature field for many devices at once. The summed-area
+    # table S[i,j] = sum of T[:i,:j] gives the sum over any rectangle of grid points from four
+    # entries. Read as the integral of T taken constant on the cell [i,i+1) x [j,j+1), S is bilinear
+    # inside every cell, so interpolating it gives the area-weighted sum over rectangles with
+    # fractional bounds as well. Bounds are in grid steps and clipped to the field.
+
+    def __init__(self,T):
+        self.T = np.asarray(T)
+        self.shape = self.T.shape
+        self.S = np.zeros((self.shape[0]+1,self.shape[1]+1))
+        np.cumsum(np.cumsum(self.T,axis=0),axis=1,out=self.S[1:,1:])
+        self.window_max = {}
+
+    def integral(self,x,z):
+        # S at the (fractional) positions x, z
+        x = np.clip(np.asarray(x,dtype=float),0,self.shape[0])
+        z = np.clip(np.asarray(z,dtype=float),0,self.shape[1])
+        i = np.minimum(np.floor(x).astype(int),self.shape[0]-1)
+        j = np.minimum(np.floor(z).astype(int),self.shape[1]-1)
+        fx = x - i
+        fz = z - j
+        return ((1-fx)*(1-fz)*self.S[i,j] + fx*(1-fz)*self.S[i+1,j] +
+                (1-fx)*fz*self.S[i,j+1] + fx*fz*self.S[i+1,j+1])
+
+    def average(self,x_low,x_up,z_low,z_up):
+        # mean of T over [x_low,x_up) x [z_low,z_up), partial cells weighted by the covered area
+        x_low = np.clip(np.asarray(x_low,dtype=float),0,self.shape[0])
+        x_up = np.clip(np.asarray(x_up,dtype=float),x_low,self.shape[0])
+        z_low = np.clip(np.asarray(z_low,dtype=float),0,self.shape[1])
+        z_up = np.clip(np.asarray(z_up,dtype=float),z_low,self.shape[1])
+        total = (self.integral(x_up,z_up) - self.integral(x_low,z_up) -
+                 self.integral(x_up,z_low) + self.integral(x_low,z_low))
+        with np.errstate(invalid="ignore",divide="ignore"):
+            return total/((x_up-x_low)*(z_up-z_low))
+
+    def maximum(self,x_low,x_up,z_low,z_up):
+        # max of T over the grid points [x_low,x_up) x [z_low,z_up), integer bounds. Devices
+        # sharing a window size share one sliding max of the field when that is cheaper than
+        # reading their windows one by one.
+        x_low = np.clip(np.asarray(x_low,dtype=int),0,self.shape[0])
+        x_up = np.clip(np.asarray(x_up,dtype=int),x_low,self.shape[0])
+        z_low = np.clip(np.asarray(z_low,dtype=int),0,self.shape[1])
+        z_up = np.clip(np.asarray(z_up,dtype=int),z_low,self.shape[1])
+        wx = x_up - x_low
+        wz = z_up - z_low
+
+        result = np.full(x_low.shape,np.nan)
+        for size in set(zip(wx.ravel(),wz.ravel())):
+            if size[0] == 0 or size[1] == 0:
+                continue
+            members = (wx == size[0]) & (wz == size[1])
+            if np.count_nonzero(members)*size[0]*size[1] < self.T.size and size not in self.window_max:
+                for i in zip(*np.nonzero(members)):
+                    result[i] = self.T[x_low[i]:x_up[i],z_low[i]:z_up[i]].max()
+                continue
+            if size not in self.window_max:
+                self.window_max[size] = sliding_max(sliding_max(self.T,size[0],0),size[1],1)
+            result[members] = self.window_max[size][x_low[members],z_low[members]]
+        return result
@@ -0,0 +1,152 @@
+import threading
+from collections import OrderedDict
+
+import telemetry
+from transistor import Transistor
+
+class KernelCache:
+    # Unit-power contribution fields (plate + mirror sources) of one package type. A kernel with
+    # half sizes (hx,hz) holds the temperature rise for every offset -hx..hx, -hz..hz from a 1 W
+    # transistor centred on a grid point, so the field of any transistor centred on a grid point
+    # is a shifted view of it multiplied by the power.
+    #
+    # A kernel covers four times the view, so field() builds it only on the min_uses-th request for
+    # its package, and never when it would not fit into max_bytes. Until then the caller computes
+    # the field of the transistor directly, a layout with one device of a package pays nothing.
+
+    def __init__(self,max_bytes=512*2**20,min_uses=2):
+        self.max_bytes = max_bytes           # memory cap, least recently used kernels are evicted first
+        self.min_uses = min_uses             # requests for a package before field() builds its kernel
+        self.kernels = OrderedDict()
+        self.uses = {}
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.skips = 0
+        self.evictions = 0
+        self.disk = None                     # DiskCache keeping the kernels between runs
+        self.lock = threading.RLock()        # lookups from several threads, a kernel is only built once
+
+    def unit_field(self,width,length,accurate,thickness,num_mirror_sources,nump,k,half_x,half_z):
+        with self.lock:
+            return self.unit_field_locked(width,length,accurate,thickness,num_mirror_sources,nump,k,half_x,half_z)
+
+    def unit_field_locked(self,width,length,accurate,thickness,num_mirror_sources,nump,k,half_x,half_z):
+        # lookups are timed as the "kernel_cache" stage, a kernel build only by the stages of
+        # Transistor.calc_field, so that the stage totals do not count it twice
+        tm = telemetry.active
+        key = (width,length,accurate,thickness,num_mirror_sources,nump,k)
+        with tm.stage("kernel_cache"):
+            K = self.kernels.get(key)
+
+            if K is not None and (K.shape[0]-1)//2 >= half_x and (K.shape[1]-1)//2 >= half_z:
+                self.hits += 1
+                self.kernels.move_to_end(key)
+                return K
+
+            # a kernel which is too small is replaced by one covering both extents
+            self.misses += 1
+            if K is not None:
+                half_x = max(half_x,(K.shape[0]-1)//2)
+                half_z = max(half_z,(K.shape[1]-1)//2)
+                self.remove(key)
+
+            K = self.load_kernel(key,half_x,half_z)
+
+        if K is None:
+            template = Transistor(1,half_x/nump,half_z/nump)
+            template.width = width
+            template.length = length
+            template.accurate = accurate
+            K = template.calc_field(nump,0,2*half_x+1,0,2*half_z+1,k,thickness,num_mirror_sources)
+            if self.disk is not None:
+                with tm.stage("kernel_cache"):
+                    self.disk.store(self.disk.key("kernel",key),K)
+
+        # a kernel above the cap is handed out but not kept
+        if K.nbytes > self.max_bytes:
+            return K
+        with tm.stage("kernel_cache"):
+            self.kernels[key] = K
+            self.nbytes += K.nbytes
+            while self.nbytes > self.max_bytes:
+                self.remove(next(iter(self.kernels)))
+                self.evictions += 1
+        return K
+
+    def contribution(self,transistor,nump,view_x,view_z,k,thickness,num_mirror_sources):
+        np_x = int(view_x*nump)
+        np_z = int(view_z*nump)
+        return self.field(transistor,nump,0,np_x,0,np_z,k,thickness,num_mirror_sources,np_x,np_z)
+
+    def field(self,transistor,nump,x_start,x_stop,z_start,z_stop,k,thickness,num_mirror_sources,min_half_x=0,min_half_z=0):
+        # Field of transistor on the grid points [x_start,x_stop) x [z_start,z_stop), or None if it
+        # can not be taken from a kernel because the centre is not on a grid point or the footprint
+        # crosses the lower plate edges, or if the kernel is not built (yet, see above). Kernels are
+        # built with at least the given half sizes.
+        cx = transistor.x0*nump
+        cz = transistor.z0*nump
+        if abs(cx - round(cx)) > 1e-9 or abs(cz - round(cz)) > 1e-9:
+            return None
+        if transistor.x0 - transistor.width*0.5 < 0 or transistor.z0 - transistor.length*0.5 < 0:
+            return None
+
+        cx = int(round(cx))
+        cz = int(round(cz))
+        half_x = max(min_half_x, cx-x_start, x_stop-1-cx)
+        half_z = max(min_half_z, cz-z_start, z_stop-1-cz)
+
+        with self.lock:
+            if not self.wanted((transistor.width,transistor.length,transistor.accurate,thickness,num_mirror_sources,nump,k),half_x,half_z):
+                return None
+            K = self.unit_field_locked(transistor.width,transistor.length,transistor.accurate,thickness,num_mirror_sources,nump,k,half_x,half_z)
+        half_x = (K.shape[0]-1)//2
+        half_z = (K.shape[1]-1)//2
+
+        with telemetry.active.stage("kernel_cache"):
+            return transistor.power*K[half_x-cx+x_start:half_x-cx+x_stop, half_z-cz+z_start:half_z-cz+z_stop]
+
+    def wanted(self,key,half_x,half_z):
+        # whether field() takes the kernel of key, counting the request
+        if (2*half_x+1)*(2*half_z+1)*8 > self.max_bytes:      # float64
+            self.skips += 1
+            return False
+        if key in self.kernels:
+            return True
+        self.uses[key] = self.uses.get(key,0) + 1
+        if self.uses[key] < self.min_uses:
+            self.skips += 1
+            return False
+        return True
+
+    def load_kernel(self,key,half_x,half_z):
+        # kernel from the disk cache if there is one of at least the given half sizes
+        if self.disk is None:
+            return None
+        K = self.disk.load(self.disk.key("kernel",key))
+        if K is None or (K.shape[0]-1)//2 < half_x or (K.shape[1]-1)//2 < half_z:
+            return None
+        return K
+
+    def remove(self,key):
+        self.nbytes -= self.kernels.pop(key).nbytes
+
+    def clear(self):
+        with self.lock:
+            self.kernels.clear()
+            self.uses.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "skips": self.skips,
+                "evictions": self.evictions,
+                "entries": len(self.kernels),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hit_rate": self.hits/lookups if lookups else 0.0}
+
+# shared by all baseplates so that sweeps building a new baseplate per point still reuse kernels
+default_cache = KernelCache()
@@ -1,4 +1,5 @@
 from simulations import Simulation
+import disk_cache
 
 # Constants
 THERMAL_CONDUCTIVITY_ALUMINIUM  = 238
@@ -10,8 +11,9 @@ THERMAL_CONDUCTIVITY_COPPER     = 401
 k                   = THERMAL_CONDUCTIVITY_ALUMINIUM
 baseplate_thickness = 10 # mm
 npmm                = 5  # points/mm
-ms                  = 1  # number of mirror sources
+ms                  = 1  # number of mirror sources, None to add them until the change is below Baseplate.mirror_tolerance
 Ta                  = 25
+cache_directory     = None  # keep solved fields and kernels in this directory between runs
 # =-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 
 # =-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
@@ -21,6 +23,9 @@ d   = 25 #mm
 num = 4
 pwr = 25 #W
 
+if cache_directory is not None:
+    disk_cache.configure(cache_directory)
+
 simulation = Simulation(k,baseplate_thickness,npmm,ms,Ta)
 simulation.case_horisontal_line(d,num,pwr)
 
@@ -0,0 +1,259 @@
+import time
+
+import numpy as np
+
+import telemetry
+from baseplate import Baseplate
+from kernel_cache import default_cache
+from transistor import Transistor
+
+class OptimizationResult:
+    def __init__(self,positions,rotated,device_tj,max_tj,verified_tj,evaluations,trace):
+        self.positions = positions            # (x0, z0) in mm per device
+        self.rotated = rotated                # True where the package is turned with change_direction
+        self.device_tj = device_tj            # junction temperature per device from the batch model
+        self.max_tj = max_tj
+        self.verified_tj = verified_tj        # max junction temperature of the best layout from a Baseplate solve
+        self.evaluations = evaluations
+        self.trace = trace                    # (evaluations, seconds, best max Tj) after every step
+
+class LayoutOptimizer:
+    # Searches positions and orientations of the transistors on a plate for the lowest max junction
+    # temperature. Candidates keep the centres on grid points, which makes the field of every device
+    # a shifted copy of one unit kernel per orientation (see KernelCache), so a whole population of
+    # layouts is scored at once with array gathers instead of one Baseplate per candidate.
+    #
+    # Constraints: every package keeps `edge` mm to the plate border, `spacing` mm to every other
+    # package (along x or z) and does not overlap any keep_out rectangle (x_min, z_min, x_max, z_max).
+
+    def __init__(self,plate_x,plate_z,powers,k,thickness,nump,num_mirror_sources,Ta,
+                 spacing=1.0,edge=1.0,keep_out=(),max_point=True,population=32,seed=None):
+        self.plate_x = plate_x
+        self.plate_z = plate_z
+        self.powers = np.asarray(powers,dtype=float)
+        self.k = k
+        self.thickness = thickness
+        self.nump = nump
+        self.num_mirror_sources = num_mirror_sources
+        self.Ta = Ta
+        self.spacing = spacing
+        self.edge = edge
+        self.keep_out = np.asarray(keep_out,dtype=float).reshape(-1,4)
+        self.max_point = max_point
+        self.population = population
+        self.rng = np.random.default_rng(seed)
+        self.kernel_cache = default_cache
+
+        package = Transistor(0,0,0)
+        self.Rth = package.Rth
+        self.sizes = np.array([[package.width,package.length],[package.length,package.width]])   # (x, z) size per orientation
+
+        self.np_x = int(plate_x*nump)
+        self.np_z = int(plate_z*nump)
+        self.mirror_order = self.resolve_mirror_order(num_mirror_sources)
+        self.prepare_kernels()
+
+    def resolve_mirror_order(self,num_mirror_sources):
+        # None: the order the adaptive series reaches with the total power in one device at the
+        # plate centre, the kernels are then the averaged estimates of that order and the one before
+        if num_mirror_sources is not None:
+            return num_mirror_sources
+        baseplate = Baseplate(self.k,self.thickness,self.Ta)
+        baseplate.change_view_range(self.plate_x,self.plate_z,self.nump)
+        baseplate.add_transistor(float(np.sum(self.powers)),self.plate_x*0.5,self.plate_z*0.5)
+        return baseplate.resolve_mirror_order(None)
+
+    def unit_kernel(self,width,length,order):
+        # kernel with half sizes (np_x, np_z), the shared cache may hold a larger one of an earlier solve
+        K = self.kernel_cache.unit_field(width,length,True,self.thickness,order,self.nump,self.k,self.np_x,self.np_z)
+        h = (K.shape[0]-1)//2
+        g = (K.shape[1]-1)//2
+        return K[h-self.np_x:h+self.np_x+1, g-self.np_z:g+self.np_z+1]
+
+    def prepare_kernels(self):
+        kernels = []
+        self.cells = []
+        for width,length in self.sizes:
+            kernel = self.unit_kernel(width,length,self.mirror_order)
+            if self.num_mirror_sources is None and self.mirror_order > 0:
+                kernel = 0.5*(kernel + self.unit_kernel(width,length,self.mirror_order-1))
+            kernels.append(kernel)
+            # footprint grid points relative to a centre on grid point c, as in Transistor.footprint_indices
+            c_x = self.np_x
+            c_z = self.np_z
+            template = Transistor(0,c_x/self.nump,c_z/self.nump)
+            template.width = width
+            template.length = length
+            x_low,x_up,z_low,z_up = template.footprint_indices(self.nump)
+            fx,fz = np.meshgrid(np.arange(x_low,x_up)-c_x,np.arange(z_low,z_up)-c_z,indexing="ij")
+            self.cells.append((fx.ravel(),fz.ravel()))
+
+        self.half_x = self.np_x
+        self.half_z = self.np_z
+        self.kernels = np.stack(kernels)
+
+        # both orientations padded to the same number of points, padding repeats the first point
+        count = max(len(fx) for fx,fz in self.cells)
+        self.cell_x = np.zeros((2,count),dtype=int)
+        self.cell_z = np.zeros((2,count),dtype=int)
+        self.cell_w = np.zeros((2,count))
+        for o,(fx,fz) in enumerate(self.cells):
+            self.cell_x[o] = np.concatenate([fx,np.full(count-len(fx),fx[0])])
+            self.cell_z[o] = np.concatenate([fz,np.full(count-len(fz),fz[0])])
+            self.cell_w[o,:len(fx)] = 1.0
+
+    def feasible(self,cx,cz,o):
+        # cx, cz, o of shape (B, N) -> (B,) bool
+        x0 = cx/self.nump
+        z0 = cz/self.nump
+        sx = self.sizes[o,0]*0.5
+        sz = self.sizes[o,1]*0.5
+
+        ok = np.all((x0-sx >= self.edge) & (x0+sx <= self.plate_x-self.edge) &
+                    (z0-sz >= self.edge) & (z0+sz <= self.plate_z-self.edge),axis=1)
+
+        gap_x = np.abs(x0[:,:,None]-x0[:,None,:]) - (sx[:,:,None]+sx[:,None,:])
+        gap_z = np.abs(z0[:,:,None]-z0[:,None,:]) - (sz[:,:,None]+sz[:,None,:])
+        apart = (gap_x >= self.spacing) | (gap_z >= self.spacing)
+        apart |= np.eye(x0.shape[1],dtype=bool)
+        ok &= np.all(apart,axis=(1,2))
+
+        for x_min,z_min,x_max,z_max in self.keep_out:
+            overlap = (x0+sx > x_min) & (x0-sx < x_max) & (z0+sz > z_min) & (z0-sz < z_max)
+            ok &= ~np.any(overlap,axis=1)
+        return ok
+
+    def junction_temperatures(self,cx,cz,o):
+        # (B, N) layouts -> (B, N) junction temperatures
+        gx = cx[:,:,None] + self.cell_x[o]                 # (B, N, points)
+        gz = cz[:,:,None] + self.cell_z[o]
+        T = np.zeros(gx.shape)
+        for j in range(cx.shape[1]):
+            T += self.powers[j]*self.kernels[o[:,j,None,None],
+                                             gx - cx[:,j,None,None] + self.half_x,
+                                             gz - cz[:,j,None,None] + self.half_z]
+        if self.max_point:
+            Tc = np.max(T,axis=2)
+        else:
+            weights = self.cell_w[o]
+            Tc = np.sum(T*weights,axis=2)/np.sum(weights,axis=2)
+        return Tc + self.Ta + self.Rth*self.powers
+
+    def score(self,cx,cz,o):
+        scores = np.full(cx.shape[0],np.inf)
+        ok = self.feasible(cx,cz,o)
+        if np.any(ok):
+            scores[ok] = np.max(self.junction_temperatures(cx[ok],cz[ok],o[ok]),axis=1)
+        return scores
+
+    def random_layouts(self,count,tries=200):
+        n = len(self.powers)
+        cx = np.zeros((count,n),dtype=int)
+        cz = np.zeros((count,n),dtype=int)
+        o = np.zeros((count,n),dtype=int)
+        todo = np.arange(count)
+        for i in range(tries):
+            o[todo] = self.rng.integers(0,2,(len(todo),n))
+            cx[todo] = self.rng.integers(0,self.np_x,(len(todo),n))
+            cz[todo] = self.rng.integers(0,self.np_z,(len(todo),n))
+            todo = todo[~self.feasible(cx[todo],cz[todo],o[todo])]
+            if len(todo) == 0:
+                break
+        if len(todo) == count:
+            raise ValueError("No feasible layout found, the plate is too small for the devices and constraints")
+        # candidates without a feasible draw restart from feasible ones
+        ok = np.setdiff1d(np.arange(count),todo)
+        source = self.rng.choice(ok,len(todo))
+        cx[todo],cz[todo],o[todo] = cx[source],cz[source],o[source]
+        return cx,cz,o
+
+    def mutate(self,cx,cz,o,step):
+        cx,cz,o = cx.copy(),cz.copy(),o.copy()
+        batch,n = cx.shape
+        rows = np.arange(batch)
+        device = self.rng.integers(0,n,batch)
+        move = self.rng.random(batch)
+
+        shift = np.maximum(1,np.round(np.abs(self.rng.normal(0,step,(batch,2))))).astype(int)*self.rng.choice([-1,1],(batch,2))
+        moved = move < 0.7
+        cx[rows[moved],device[moved]] += shift[moved,0]
+        cz[rows[moved],device[moved]] += shift[moved,1]
+
+        rotated = (move >= 0.7) & (move < 0.85)
+        o[rows[rotated],device[rotated]] ^= 1
+
+        # swap the positions of two devices, only changes anything for different powers
+        swapped = rows[move >= 0.85]
+        other = self.rng.integers(0,n,len(swapped))
+        for array in (cx,cz,o):
+            first = array[swapped,device[swapped]].copy()
+            array[swapped,device[swapped]] = array[swapped,other]
+            array[swapped,other] = first
+        return cx,cz,o
+
+    def optimize(self,max_evaluations=5000,max_time=None,temperature=1.0):
+        # Population of independent annealing chains: every step mutates all members, scores the
+        # batch and accepts worse layouts with probability exp(-dT/temperature), where temperature
+        # and step size shrink linearly with the used budget.
+        tm = telemetry.active
+        start = time.perf_counter()
+
+        cx,cz,o = self.random_layouts(self.population)
+        scores = self.score(cx,cz,o)
+        evaluations = len(scores)
+
+        best = np.argmin(scores)
+        best_layout = (cx[best].copy(),cz[best].copy(),o[best].copy())
+        best_score = scores[best]
+        trace = [(evaluations,time.perf_counter()-start,float(best_score))]
+        initial_step = max(self.np_x,self.np_z)*0.1
+
+        while evaluations < max_evaluations:
+            elapsed = time.perf_counter() - start
+            if max_time is not None and elapsed >= max_time:
+                break
+            progress = evaluations/max_evaluations
+            if max_time is not None:
+                progress = max(progress,elapsed/max_time)
+
+            new_cx,new_cz,new_o = self.mutate(cx,cz,o,max(1.0,initial_step*(1-progress)))
+            new_scores = self.score(new_cx,new_cz,new_o)
+            evaluations += len(new_scores)
+
+            current = max(temperature*(1-progress),1e-9)
+            with np.errstate(invalid="ignore",over="ignore"):
+                accept = (new_scores <= scores) | (self.rng.random(len(scores)) < np.exp(-(new_scores-scores)/current))
+            accept &= np.isfinite(new_scores)
+            cx[accept],cz[accept],o[accept] = new_cx[accept],new_cz[accept],new_o[accept]
+            scores[accept] = new_scores[accept]
+
+            step_best = np.argmin(scores)
+            if scores[step_best] < best_score:
+                best_score = scores[step_best]
+                best_layout = (cx[step_best].copy(),cz[step_best].copy(),o[step_best].copy())
+            trace.append((evaluations,time.perf_counter()-start,float(best_score)))
+            tm.progress("optimize",evaluations,max_evaluations)
+
+        bx,bz,bo = best_layout
+        device_tj = self.junction_temperatures(bx[None],bz[None],bo[None])[0]
+        positions = [(float(x/self.nump),float(z/self.nump)) for x,z in zip(bx,bz)]
+        rotated = [bool(r) for r in bo]
+
+        baseplate = self.baseplate(positions,rotated)
+        baseplate.solver = "footprint"
+        T = baseplate.calculate_temperature_matrix(self.num_mirror_sources)
+        verified = max(transistor.estimate_junction_temperature(T,self.nump,self.max_point,self.Ta)
+                       for transistor in baseplate.transistor_array)
+
+        tm.log(telemetry.INFO,"Layout search: %d evaluations, best max Tj %.3f (Baseplate solve %.3f)",evaluations,best_score,verified)
+        return OptimizationResult(positions,rotated,[float(t) for t in device_tj],float(best_score),float(verified),evaluations,trace)
+
+    def baseplate(self,positions,rotated):
+        baseplate = Baseplate(self.k,self.thickness,self.Ta)
+        baseplate.change_view_range(self.plate_x,self.plate_z,self.nump)
+        baseplate.max_estimation = self.max_point
+        for power,(x0,z0),turn in zip(self.powers,positions,rotated):
+            baseplate.add_transistor(float(power),x0,z0)
+            if turn:
+                baseplate.transistor_array[-1].change_direction()
+        return baseplate
@@ -0,0 +1,104 @@
+import os
+import queue
+import threading
+
+import numpy as np
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.patches import Rectangle
+
+from results import FieldResult
+
+FONT_SIZE = 30
+
+def draw_field(ax,result,filled=False):
+    if not isinstance(result.T,np.ndarray):
+        raise TypeError("The result has no full temperature matrix to plot (solver \"footprint\"), "
+                        "solve with the \"direct\", \"fft\", \"tiled\" or \"composite\" solver")
+    np_x = int(result.view_x * result.nump)
+    np_z = int(result.view_z * result.nump)
+
+    xlist = np.linspace(0, result.view_x, np_x)
+    zlist = np.linspace(0, result.view_z, np_z)
+    X, Z = np.meshgrid(xlist, zlist)
+
+    for device in result.devices:
+        ax.add_patch(Rectangle((device.z0-device.length*0.5,device.x0-device.width*0.5),device.length,device.width,color="grey"))
+
+    if filled:
+        ax.contourf(X, Z, result.T, 50,cmap="inferno")        #https://matplotlib.org/stable/tutorials/colors/colormaps.html
+    else:
+        cp = ax.contour(X,Z,result.T,40,cmap="inferno")
+        ax.clabel(cp, inline=True, fontsize=10)
+        ax.set_xlabel("z [mm]")
+        ax.set_ylabel("x [mm]")
+
+def draw_sweep(ax,result):
+    ax.grid()
+    ax.set_xlabel(result.xlabel)
+    ax.set_ylabel(result.ylabel)
+    if result.plain_ticks:
+        ax.ticklabel_format(useOffset=False, style='plain')
+    ax.plot(result.x, result.y, lw=4, c="black")
+
+def draw(ax,result,filled=False):
+    if isinstance(result,FieldResult):
+        draw_field(ax,result,filled)
+    else:
+        draw_sweep(ax,result)
+
+def show(result,filled=False):
+    import matplotlib.pyplot as plt
+    plt.rc('font', size=FONT_SIZE)
+    fig,ax = plt.subplots(1,1)
+    draw(ax,result,filled)
+    plt.show()
+
+class Renderer:
+    # Writes results to image files from a background thread, so the computation does not wait
+    # for matplotlib and no display is needed. Uses Figure objects directly instead of pyplot.
+
+    def __init__(self,directory,fmt="png",filled=False,figsize=(16,12),dpi=100):
+        self.directory = directory
+        self.fmt = fmt
+        self.filled = filled
+        self.figsize = figsize
+        self.dpi = dpi
+        self.count = 0
+        self.files = []
+        self.errors = []
+        os.makedirs(directory,exist_ok=True)
+
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run,daemon=True)
+        self.thread.start()
+
+    def submit(self,result,name):
+        self.count += 1
+        path = os.path.join(self.directory,"%04d_%s.%s" % (self.count,name,self.fmt))
+        self.queue.put((result,path))
+        return path
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            result,path = item
+            try:
+                with matplotlib.rc_context({"font.size": FONT_SIZE}):
+                    fig = Figure(figsize=self.figsize)
+                    draw(fig.add_subplot(1,1,1),result,self.filled)
+                    fig.savefig(path,dpi=self.dpi)
+                self.files.append(path)
+            except Exception as error:
+                self.errors.append((path,error))
+            self.queue.task_done()
+
+    def wait(self):
+        self.queue.join()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
@@ -0,0 +1,31 @@
+class DeviceResult:
+    def __init__(self,x0,z0,width,length,power,tc_avg,tc_max,Ta,Rth):
+        self.x0 = x0
+        self.z0 = z0
+        self.width = width
+        self.length = length
+        self.power = power
+        self.tc_avg = float(tc_avg)           # case temperature increase over ambient
+        self.tc_max = float(tc_max)
+        self.tj_avg = self.tc_avg + Ta + Rth*power    # junction temperature
+        self.tj_max = self.tc_max + Ta + Rth*power
+
+    def as_dict(self):
+        return dict(vars(self))
+
+class FieldResult:
+    def __init__(self,T,view_x,view_z,nump,Ta,devices):
+        self.T = T                            # surface temperature increase, shape (view_x*nump, view_z*nump)
+        self.view_x = view_x
+        self.view_z = view_z
+        self.nump = nump
+        self.Ta = Ta
+        self.devices = devices                # DeviceResult per transistor, in baseplate order
+
+class SweepResult:
+    def __init__(self,x,y,xlabel,ylabel,plain_ticks=False):
+        self.x = list(x)
+        self.y = list(y)
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+        self.plain_ticks = plain_ticks
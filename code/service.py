@@ -0,0 +1,286 @@
+import argparse
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import telemetry
+from batch import parse_cases, case_parameters, build_baseplate, device_records
+from kernel_cache import default_cache
+from results import DeviceResult, FieldResult
+
+# Resident solver on a local HTTP port, so that design tools pay the imports and the kernels once.
+#
+#   POST /solve   {"cases": [...], "field": false}   cases as in a batch JSON spec, sweeps included
+#                 -> {"results": [record, ...]}        records as written by batch.py, with the
+#                                                      field as nested lists when "field" is true
+#   GET  /stats   counters of the service and the kernel cache
+#
+# Kernels stay in the shared kernel cache and finished records in an LRU of at most max_results
+# entries and max_bytes, fields kept as arrays and turned into lists for every reply.
+# Cases arriving within `window` seconds of each other with the same geometry (everything except
+# the powers, Ta and the evaluation rule) are solved together: the field is linear in the powers,
+# so one set of unit responses per device serves all of them.
+
+COALESCED_SOLVERS = ("direct","footprint")
+
+def geometry_key(case):
+    p = case_parameters(case)
+    devices = [(d["x0"],d["z0"],d.get("width"),d.get("length"),bool(d.get("rotated"))) for d in case["devices"]]
+    return json.dumps([p["k"],p["thickness"],p["nump"],p["view_x"],p["view_z"],p["ms"],p["solver"],devices])
+
+class Group:
+    # cases waiting for one coalesced solve
+    def __init__(self):
+        self.cases = []
+        self.records = None
+        self.error = None
+        self.done = threading.Event()
+
+class SolverService:
+    def __init__(self,host="127.0.0.1",port=8765,window=0.02,max_results=10000,max_bytes=256*2**20):
+        self.window = window
+        self.max_results = max_results
+        self.max_bytes = max_bytes
+        self.results = OrderedDict()         # key -> (record, bytes)
+        self.nbytes = 0
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "cases": 0, "result_hits": 0, "solves": 0, "coalesced": 0}
+        self.server = ThreadingHTTPServer((host,port),Handler)
+        self.server.daemon_threads = True
+        self.server.service = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host,port = self.server.server_address[:2]
+        return "http://%s:%d" % (host,port)
+
+    def start(self):
+        # serve from a background thread, e.g. for tests
+        self.thread = threading.Thread(target=self.server.serve_forever,daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self,name,n=1):
+        with self.lock:
+            self.counts[name] += n
+
+    def stats(self):
+        with self.lock:
+            counts = dict(self.counts)
+            counts["cached_results"] = len(self.results)
+            counts["cached_bytes"] = self.nbytes
+        counts["kernel_cache"] = default_cache.stats()
+        return counts
+
+    def solve(self,payload):
+        field = bool(payload.pop("field",False)) if isinstance(payload,dict) else False
+        cases = parse_cases(payload)
+        self.count("requests")
+        self.count("cases",len(cases))
+        if len(cases) == 1:
+            return [self.solve_case(cases[0],field)]
+        # the cases of one request coalesce with each other as well
+        with ThreadPoolExecutor(max_workers=min(len(cases),32)) as pool:
+            return list(pool.map(lambda case: self.solve_case(case,field),cases))
+
+    def solve_case(self,case,field):
+        key = json.dumps([{name: value for name,value in case.items() if name != "id"},field],sort_keys=True)
+        with self.lock:
+            entry = self.results.get(key)
+            if entry is not None:
+                self.results.move_to_end(key)
+                self.counts["result_hits"] += 1
+        if entry is not None:
+            record = entry[0]
+        else:
+            p = case_parameters(case)
+            if p["ms"] is not None and p["solver"] in COALESCED_SOLVERS:
+                record = self.coalesce(case,field)
+            else:
+                record = self.solve_group([(case,field)])[0]
+            self.store(key,record)
+
+        record = dict(record,id=case["id"])
+        if record["field"] is not None:
+            record["field"] = record["field"].tolist()
+        return record
+
+    def store(self,key,record):
+        # LRU entry of the record, a record larger than max_bytes is not kept
+        size = len(json.dumps(record["devices"])) + len(key)
+        if record["field"] is not None:
+            size += record["field"].nbytes
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.results:
+                return
+            self.results[key] = (record,size)
+            self.nbytes += size
+            while len(self.results) > self.max_results or self.nbytes > self.max_bytes:
+                self.nbytes -= self.results.popitem(last=False)[1][1]
+
+    def coalesce(self,case,field):
+        key = geometry_key(case)
+        with self.lock:
+            group = self.pending.get(key)
+            leader = group is None
+            if leader:
+                group = Group()
+                self.pending[key] = group
+            slot = len(group.cases)
+            group.cases.append((case,field))
+
+        if leader:
+            time.sleep(self.window)
+            with self.lock:
+                del self.pending[key]
+            try:
+                group.records = self.solve_group(group.cases)
+            except Exception as e:
+                group.error = e
+            group.done.set()
+        else:
+            group.done.wait()
+
+        if group.error is not None:
+            raise group.error
+        return group.records[slot]
+
+    def solve_group(self,cases):
+        # cases with one geometry: unit responses of every device once, then each case's powers
+        start = time.perf_counter()
+        self.count("solves")
+        self.count("coalesced",len(cases)-1)
+        tm = telemetry.active
+        tm.log(telemetry.INFO,"Solving %d case(s) with one geometry",len(cases))
+
+        case,field = cases[0]
+        p = case_parameters(case)
+        baseplate = build_baseplate(case)
+        if len(cases) == 1:
+            T = baseplate.calculate_temperature_matrix(p["ms"])
+            result = baseplate.field_result(T)
+            return [self.record(p,result,field,time.perf_counter()-start)]
+
+        coupling = baseplate.build_coupling(p["ms"])
+        # fields as the single solves give them, which have none for the footprint solver
+        fields = None
+        with_field = p["solver"] == "direct"
+        if with_field and any(field for case,field in cases):
+            fields = self.unit_fields(baseplate,p["ms"])
+
+        records = []
+        for case,field in cases:
+            p = case_parameters(case)
+            plate = build_baseplate(case)
+            devices = plate.transistor_array
+            tc_avg = coupling.case_temperature(devices.power,False)
+            tc_max = coupling.case_temperature(devices.power,True)
+            results = [DeviceResult(t.x0,t.z0,t.width,t.length,t.power,avg,peak,p["Ta"],t.Rth)
+                       for t,avg,peak in zip(devices,tc_avg,tc_max)]
+            T = np.tensordot(devices.power,fields,1) if field and with_field else None
+            records.append(self.record(p,FieldResult(T,p["view_x"],p["view_z"],p["nump"],p["Ta"],results),field,time.perf_counter()-start))
+        return records
+
+    def unit_fields(self,baseplate,num_mirror_sources):
+        devices = baseplate.transistor_array
+        powers = devices.power.copy()
+        try:
+            devices.power[:] = 1.0
+            return np.stack([baseplate.calc_transistor_contribution(transistor,num_mirror_sources) for transistor in devices])
+        finally:
+            devices.power[:] = powers
+
+    def record(self,p,result,field,seconds):
+        record = {"params": p, "devices": device_records(result), "field": None, "seconds": seconds}
+        if field and isinstance(result.T,np.ndarray):
+            record["field"] = np.asarray(result.T)
+        return record
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/stats":
+            self.reply(200,self.server.service.stats())
+        else:
+            self.reply(404,{"error": "unknown path " + self.path})
+
+    def do_POST(self):
+        if self.path != "/solve":
+            self.reply(404,{"error": "unknown path " + self.path})
+            return
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length",0))))
+            self.reply(200,{"results": self.server.service.solve(payload)})
+        except (ValueError,KeyError,TypeError) as e:
+            self.reply(400,{"error": str(e)})
+        except Exception as e:
+            telemetry.active.log(telemetry.INFO,"Request failed: %s: %s",type(e).__name__,e)
+            self.reply(500,{"error": type(e).__name__ + ": " + str(e)})
+
+    def reply(self,status,body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type","application/json")
+        self.send_header("Content-Length",str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self,format,*args):
+        telemetry.active.log(telemetry.DEBUG,"%s - " + format,self.address_string(),*args)
+
+# client
+
+def post(url,path,payload,timeout):
+    request = urllib.request.Request(url.rstrip("/") + path,data=json.dumps(payload).encode(),
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request,timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        raise ValueError(json.loads(e.read()).get("error",str(e)))
+
+def solve(url,cases,field=False,timeout=600):
+    # records of the cases (one case dict or a list) from the service at url
+    cases = [cases] if isinstance(cases,dict) else list(cases)
+    return post(url,"/solve",{"cases": cases, "field": field},timeout)["results"]
+
+def stats(url,timeout=10):
+    with urllib.request.urlopen(url.rstrip("/") + "/stats",timeout=timeout) as response:
+        return json.loads(response.read())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resident baseplate solver on a local HTTP port")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--window", type=float, default=0.02, help="seconds to wait for cases with the same geometry")
+    parser.add_argument("--quiet", action="store_true", help="no progress messages")
+    args = parser.parse_args(argv)
+
+    telemetry.configure(level=telemetry.SILENT if args.quiet else telemetry.INFO)
+    service = SolverService(args.host,args.port,args.window)
+    telemetry.active.log(telemetry.INFO,"Serving on %s",service.url)
+    try:
+        service.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,54 @@
-import matplotlib.pyplot as plt
 import numpy as np
+from functools import partial
 
 from baseplate import Baseplate
+from results import SweepResult
+import telemetry
+from sweep import run_sweep, junction_temperature, case_temperature
+from optimizer import LayoutOptimizer
+
+# Layout builders and updates for the sweeps, module level so that they can be sent to worker processes
+
+def two_transistor_layout(k,h,Ta,nump,pwr,view_length,distance):
+    baseplate = Baseplate(k,h,Ta)
+    baseplate.change_view_range(view_length,view_length,nump)
+    z_pos = view_length*0.5
+    baseplate.add_transistor(pwr,view_length*0.5 - distance*0.5,z_pos)
+    baseplate.add_transistor(pwr,view_length*0.5 + distance*0.5,z_pos)
+    return baseplate
+
+def move_two_transistors(view_length,baseplate,distance):
+    z_pos = view_length*0.5
+    baseplate.update_position(1, view_length*0.5 - distance*0.5, z_pos)
+    baseplate.update_position(2, view_length*0.5 + distance*0.5, z_pos)
+
+def two_transistor_thickness_layout(k,Ta,nump,pwr,view_length,distance,h):
+    return two_transistor_layout(k,h,Ta,nump,pwr,view_length,distance)
+
+def set_thickness(baseplate,h):
+    baseplate.thickness = h
+
+def angle_layout(k,h,Ta,nump,pwr,radius,angle):
+    view_length = 2 * radius + 20
+    center = radius + 10
+    baseplate = Baseplate(k,h,Ta)
+    baseplate.change_view_range(view_length,view_length,nump)
+    baseplate.add_transistor(pwr,10,10)
+    baseplate.add_transistor(pwr,center,center)
+    move_on_circle(radius,baseplate,angle)
+    return baseplate
+
+def move_on_circle(radius,baseplate,angle):
+    center = radius + 10
+    z_pos = center + radius * np.sin(angle)
+    x_pos = center + radius * np.cos(angle)
+    baseplate.update_position(1,z_pos,x_pos)
+
+def single_transistor_layout(k,h,Ta,pwr,view_length,nump):
+    baseplate = Baseplate(k,h,Ta)
+    baseplate.change_view_range(view_length,view_length,nump)
+    baseplate.add_transistor(pwr,view_length*0.5,view_length*0.5)
+    return baseplate
 
 class Simulation:
 
@@ -11,88 +58,43 @@ class Simulation:
         self.nump = nump
         self.ms = ms
         self.Ta = Ta
+        self.rescale_k = True   # conductivity sweeps solve once and rescale instead of solving every point
+        self.workers = 1        # processes used by the sweeps, None for one per core
+        self.sweep_solver = "footprint"     # sweeps only need footprint temperatures, not the whole field
+        self.show = True        # show every result in a matplotlib window
+        self.renderer = None    # plotting.Renderer writing the results to files instead
+
+    def output(self,result,name):
+        if self.renderer is not None:
+            self.renderer.submit(result,name)
+        elif self.show:
+            import plotting
+            plotting.show(result)
+        return result
 
     def plot_2transistors_distanse(self,pwr,start_distance,end_distance,num_points):
-        baseplate = Baseplate(self.k,self.h,self.Ta)
         view_length = end_distance + 20
-        baseplate.change_view_range(view_length,view_length,self.nump)
-
-        init_x1 = view_length*0.5 - start_distance*0.5
-        init_x2 = view_length * 0.5 + start_distance * 0.5
-        z_pos   = view_length*0.5
-
-        baseplate.add_transistor(pwr,init_x1,z_pos)
-        baseplate.add_transistor(pwr,init_x2,z_pos)
-
         distances = np.linspace(start_distance,end_distance,num_points)
 
-        junction_temp = []
-        plt.rc('font', size=30)
-
-        for d in distances:
-
-            print("=========================================================================================")
-            print("Distance: " + '%.3f' % d)
-            print("=========================================================================================")
-
-            x1_pos = view_length * 0.5 - d * 0.5
-            x2_pos = view_length * 0.5 + d * 0.5
-
-            baseplate.update_position(1, x1_pos, z_pos)
-            baseplate.update_position(2, x2_pos, z_pos)
-
-            T = baseplate.calculate_temperature_matrix(self.ms)
-
-            tmp = baseplate.transistor_array[1].estimate_junction_temperature(T,self.nump,True,self.Ta)
-
-            junction_temp.append(tmp)
+        junction_temp = run_sweep(partial(two_transistor_layout,self.k,self.h,self.Ta,self.nump,pwr,view_length),
+                                  distances,self.ms,partial(junction_temperature,1,True),
+                                  update=partial(move_two_transistors,view_length),workers=self.workers,solver=self.sweep_solver)
 
         print(junction_temp)
 
-        plt.plot(distances,junction_temp, lw=4, c="black")
-        plt.grid()
-        plt.xlabel("Distance [mm]")
-        plt.ylabel("Tj [°C]")
-        plt.show()
+        return self.output(SweepResult(distances,junction_temp,"Distance [mm]","Tj [°C]"),"plot_2transistors_distanse")
 
     def plot_2transistors_thickness(self,pwr,distance,start_t,end_t,num_points):
-        baseplate = Baseplate(self.k,self.h,self.Ta)
         view_length = distance + 20
-        baseplate.change_view_range(view_length,view_length,self.nump)
-
-        x1 = view_length*0.5 - distance*0.5
-        x2 = view_length * 0.5 + distance * 0.5
-        z_pos = view_length*0.5
-
-        baseplate.add_transistor(pwr,x1,z_pos)
-        baseplate.add_transistor(pwr,x2,z_pos)
-
         thicknesses = np.linspace(start_t,end_t,num_points)
 
-        junction_temp = []
-        plt.rc('font', size=30)
-
-        for t in thicknesses:
-
-            print("=========================================================================================")
-            print("Thickness: " + '%.3f' % t)
-            print("=========================================================================================")
-
-            baseplate.thickness = t
-
-            T = baseplate.calculate_temperature_matrix(self.ms)
-
-            tmp = baseplate.transistor_array[1].estimate_junction_temperature(T,self.nump,True,self.Ta)
-
-            junction_temp.append(tmp)
+        junction_temp = run_sweep(partial(two_transistor_thickness_layout,self.k,self.Ta,self.nump,pwr,view_length,distance),
+                                  thicknesses,self.ms,partial(junction_temperature,1,True),
+                                  update=set_thickness,workers=self.workers,solver=self.sweep_solver)
 
         print(junction_temp)
 
-        plt.plot(thicknesses,junction_temp, lw=4, c="black")
-        plt.grid()
-        plt.xlabel("Thickness [mm]")
-        plt.ylabel("Tj [°C]")
-        plt.show()
+        return self.output(SweepResult(thicknesses,junction_temp,"Thickness [mm]","Tj [°C]"),"plot_2transistors_thickness")
 
     def plot_2transistors_k(self,pwr,distance,start_k,end_k,num_points):
         baseplate = Baseplate(self.k,self.h,self.Ta)
@@ -109,17 +111,21 @@ class Simulation:
         cond = np.linspace(start_k,end_k,num_points)
 
         junction_temp = []
-        plt.rc('font', size=30)
 
-        for k in cond:
+        if self.rescale_k:
+            T_plate,T_mirror = baseplate.calculate_temperature_components(self.ms)
 
-            print("=========================================================================================")
-            print("Thermal conductivity: " + '%.3f' % k)
-            print("=========================================================================================")
+        for k in cond:
 
-            baseplate.k = k
+            telemetry.active.log(telemetry.INFO,"=========================================================================================")
+            telemetry.active.log(telemetry.INFO,"Thermal conductivity: %.3f",k)
+            telemetry.active.log(telemetry.INFO,"=========================================================================================")
 
-            T = baseplate.calculate_temperature_matrix(self.ms)
+            if self.rescale_k:
+                T = baseplate.rescale_conductivity(T_plate,T_mirror,k)
+            else:
+                baseplate.k = k
+                T = baseplate.calculate_temperature_matrix(self.ms)
 
             tmp = baseplate.transistor_array[0].estimate_junction_temperature(T,self.nump,True,self.Ta)
 
@@ -127,11 +133,7 @@ class Simulation:
 
         print(junction_temp)
 
-        plt.plot(cond,junction_temp, lw=4, c="black")
-        plt.grid()
-        plt.xlabel("Thermal Conductivity [W/°C]")
-        plt.ylabel("Tj [°C]")
-        plt.show()
+        return self.output(SweepResult(cond,junction_temp,"Thermal Conductivity [W/°C]","Tj [°C]"),"plot_2transistors_k")
 
     def plot_2transistors_tmp_diff(self, pwr, distance, start_k, end_k, num_points):
             baseplate = Baseplate(self.k, self.h, self.Ta)
@@ -146,16 +148,20 @@ class Simulation:
             cond = np.linspace(start_k, end_k, num_points)
 
             junction_temp = []
-            plt.rc('font', size=30)
 
-            for k in cond:
-                print("=========================================================================================")
-                print("Thermal conductivity: " + '%.3f' % k)
-                print("=========================================================================================")
+            if self.rescale_k:
+                T_plate,T_mirror = baseplate.calculate_temperature_components(self.ms)
 
-                baseplate.k = k
+            for k in cond:
+                telemetry.active.log(telemetry.INFO,"=========================================================================================")
+                telemetry.active.log(telemetry.INFO,"Thermal conductivity: %.3f",k)
+                telemetry.active.log(telemetry.INFO,"=========================================================================================")
 
-                T = baseplate.calculate_temperature_matrix(self.ms)
+                if self.rescale_k:
+                    T = baseplate.rescale_conductivity(T_plate,T_mirror,k)
+                else:
+                    baseplate.k = k
+                    T = baseplate.calculate_temperature_matrix(self.ms)
 
                 tmp_1 = baseplate.transistor_array[0].estimate_junction_temperature(T, self.nump, True, self.Ta)
                 tmp_2 = baseplate.transistor_array[1].estimate_junction_temperature(T, self.nump, True, self.Ta)
@@ -166,11 +172,7 @@ class Simulation:
 
             print(junction_temp)
 
-            plt.plot(cond, junction_temp, lw=4, c="black")
-            plt.grid()
-            plt.xlabel("Thermal Conductivity [W/°C]")
-            plt.ylabel("Tj [°C]")
-            plt.show()
+            return self.output(SweepResult(cond,junction_temp,"Thermal Conductivity [W/°C]","Tj [°C]"),"plot_2transistors_tmp_diff")
 
     def case_vertical_line(self,distance,num_transistors,pwr):
         baseplate = Baseplate(self.k,self.h,self.Ta)
@@ -182,9 +184,9 @@ class Simulation:
         for x_pos in x_coordinates:
             baseplate.add_transistor(pwr,x_pos,z_pos)
 
-        T = baseplate.calculate_temperature_matrix(self.ms)
-        baseplate.print_transistor_stat(T)
-        baseplate.plot_contour(T)
+        result = baseplate.solve(self.ms)
+        baseplate.print_transistor_stat(result.T)
+        return self.output(result,"case_vertical_line")
 
     def case_horisontal_line(self,distance,num_transistors,pwr):
         baseplate = Baseplate(self.k,self.h,self.Ta)
@@ -196,9 +198,9 @@ class Simulation:
         for z_pos in z_coordinates:
             baseplate.add_transistor(pwr,x_pos,z_pos)
 
-        T = baseplate.calculate_temperature_matrix(self.ms)
-        baseplate.print_transistor_stat(T)
-        baseplate.plot_contour(T)
+        result = baseplate.solve(self.ms)
+        baseplate.print_transistor_stat(result.T)
+        return self.output(result,"case_horisontal_line")
 
     def case_diagonal_line(self,distance,num_transistors,pwr):
         baseplate = Baseplate(self.k, self.h,self.Ta)
@@ -210,9 +212,9 @@ class Simulation:
         for pos in coordinates:
             baseplate.add_transistor(pwr, pos, pos)
 
-        T = baseplate.calculate_temperature_matrix(self.ms)
-        baseplate.print_transistor_stat(T)
-        baseplate.plot_contour(T)
+        result = baseplate.solve(self.ms)
+        baseplate.print_transistor_stat(result.T)
+        return self.output(result,"case_diagonal_line")
 
     def case_zshape(self,distance,num_transistors,pwr):
         baseplate = Baseplate(self.k,self.h,self.Ta)
@@ -226,9 +228,9 @@ class Simulation:
             pos_z = coordinates_z[index]
             baseplate.add_transistor(pwr, pos_x, pos_z)
 
-        T = baseplate.calculate_temperature_matrix(self.ms)
-        baseplate.print_transistor_stat(T)
-        baseplate.plot_contour(T)
+        result = baseplate.solve(self.ms)
+        baseplate.print_transistor_stat(result.T)
+        return self.output(result,"case_zshape")
 
     def case_diamond(self,distance,pwr):        # Only for 4 transistors
         baseplate = Baseplate(self.k,self.h,self.Ta)
@@ -242,9 +244,9 @@ class Simulation:
         baseplate.add_transistor(pwr, center + offset, center)
         baseplate.add_transistor(pwr, center - offset, center)
 
-        T = baseplate.calculate_temperature_matrix(self.ms)
-        baseplate.print_transistor_stat(T)
-        baseplate.plot_contour(T)
+        result = baseplate.solve(self.ms)
+        baseplate.print_transistor_stat(result.T)
+        return self.output(result,"case_diamond")
 
     def case_square(self,distance,pwr):        # Only for 4 transistors
         baseplate = Baseplate(self.k,self.h,self.Ta)
@@ -258,49 +260,20 @@ class Simulation:
         baseplate.add_transistor(pwr, center + offset, center - offset)
         baseplate.add_transistor(pwr, center - offset, center - offset)
 
-        T = baseplate.calculate_temperature_matrix(self.ms)
-        baseplate.print_transistor_stat(T)
-        baseplate.plot_contour(T)
+        result = baseplate.solve(self.ms)
+        baseplate.print_transistor_stat(result.T)
+        return self.output(result,"case_square")
 
     def symetric_angle_sweep(self,radius,pwr,num_points):
-        baseplate = Baseplate(self.k,self.h,self.Ta)
-
         angle = np.linspace(0,np.pi,num_points)
 
-        view_length = 2 * radius + 20
-        center = radius + 10
-
-        baseplate.change_view_range(view_length,view_length,self.nump)
-        baseplate.add_transistor(pwr,10,10)
-        baseplate.add_transistor(pwr,center,center)
-
-        tmp_array = []
-
-        for a in angle:
-
-            print("=========================================================================================")
-            print("Angle: " + '%.3f' % a)
-            print("=========================================================================================")
-
-            z_pos = center + radius * np.sin(a)
-            x_pos = center + radius * np.cos(a)
-
-            baseplate.update_position(1,z_pos,x_pos)
-
-            T = baseplate.calculate_temperature_matrix(self.ms)
-
-            tmp = baseplate.transistor_array[1].estimate_junction_temperature(T,self.nump,True,self.Ta)
-
-            tmp_array.append(tmp)
+        tmp_array = run_sweep(partial(angle_layout,self.k,self.h,self.Ta,self.nump,pwr,radius),
+                              angle,self.ms,partial(junction_temperature,1,True),
+                              update=partial(move_on_circle,radius),workers=self.workers,solver=self.sweep_solver)
 
         print(tmp_array)
 
-        plt.grid()
-        plt.xlabel("Angle [rad]")
-        plt.ylabel("Tj [°C]")
-        plt.ticklabel_format(useOffset=False, style='plain')
-        plt.plot(angle, tmp_array, lw=4, c="black")
-        plt.show()
+        return self.output(SweepResult(angle,tmp_array,"Angle [rad]","Tj [°C]",plain_ticks=True),"symetric_angle_sweep")
 
 
     def case_zshape_with_offset(self,distance,num_transistors,pwr,offset):
@@ -315,45 +288,28 @@ class Simulation:
             pos_z = coordinates_z[index]
             baseplate.add_transistor(pwr, pos_x, pos_z)
 
-        T = baseplate.calculate_temperature_matrix(self.ms)
-        baseplate.print_transistor_stat(T)
-        baseplate.plot_contour(T)
+        result = baseplate.solve(self.ms)
+        baseplate.print_transistor_stat(result.T)
+        return self.output(result,"case_zshape_with_offset")
 
     def plot_npmm_depencence(self):
-        baseplate = Baseplate(self.k, self.h, self.Ta)
         view_length = 20
-        baseplate.change_view_range(view_length, view_length, self.nump)
-
-        x_pos = view_length * 0.5
-        z_pos = view_length * 0.5
-
-        baseplate.add_transistor(25, x_pos, z_pos)
-
         npmms = np.linspace(1, 15, 15)
 
-        junction_temp_max = []
-        junction_temp_avg = []
-        plt.rc('font', size=30)
-
-        for npmm in npmms:
-            print("=========================================================================================")
-            print("npmm: " + '%.3f' % npmm)
-            print("=========================================================================================")
-
-            baseplate.change_view_range(view_length, view_length, npmm)
-
-            T = baseplate.calculate_temperature_matrix(self.ms)
-
-            #tmp_max = baseplate.transistor_array[0].estimate_case_temperature(T, npmm, True) + self.Ta
-            tmp_avg = baseplate.transistor_array[0].estimate_case_temperature(T, npmm, False) + self.Ta
+        #junction_temp_max = run_sweep(partial(single_transistor_layout, self.k, self.h, self.Ta, 25, view_length),
+        #                              npmms, self.ms, partial(case_temperature, 0, True), workers=self.workers)
+        junction_temp_avg = run_sweep(partial(single_transistor_layout, self.k, self.h, self.Ta, 25, view_length),
+                                      npmms, self.ms, partial(case_temperature, 0, False), workers=self.workers,solver=self.sweep_solver)
 
-            #junction_temp_max.append(tmp_max)
-            junction_temp_avg.append(tmp_avg)
+        return self.output(SweepResult(npmms,junction_temp_avg,"Points per mm","Tj [°C]"),"plot_npmm_depencence")
 
+    def optimize_layout(self,plate_x,plate_z,powers,spacing=1.0,edge=1.0,keep_out=(),max_evaluations=5000,max_time=None,seed=None):
+        optimizer = LayoutOptimizer(plate_x,plate_z,powers,self.k,self.h,self.nump,self.ms,self.Ta,
+                                    spacing=spacing,edge=edge,keep_out=keep_out,seed=seed)
+        optimum = optimizer.optimize(max_evaluations,max_time)
 
-        plt.plot(npmms, junction_temp_avg, lw=4, c="black")
-        #plt.plot(npmms, junction_temp_max, lw=4, c="black",linestyle="dashed")
-        plt.grid()
-        plt.xlabel("Points per mm")
-        plt.ylabel("Tj [°C]")
-        plt.show()
+        baseplate = optimizer.baseplate(optimum.positions,optimum.rotated)
+        result = baseplate.solve(self.ms)
+        baseplate.print_transistor_stat(result.T)
+        self.output(result,"optimize_layout")
+        return optimum
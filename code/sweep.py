@@ -0,0 +1,69 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import telemetry
+
+def parameter_grid(**axes):
+    # every combination of the given axes as a list of dicts, last axis varies fastest
+    names = list(axes)
+    return [dict(zip(names,values)) for values in itertools.product(*axes.values())]
+
+def junction_temperatures(baseplate,T):
+    devices = baseplate.transistor_array
+    temps = baseplate.case_temperatures(T,baseplate.max_estimation,baseplate.statistics(T))
+    return [float(t) for t in temps + baseplate.Ta + devices.Rth*devices.power]
+
+def junction_temperature(index,max_point,baseplate,T):
+    return baseplate.transistor_array[index].estimate_junction_temperature(T,baseplate.nump,max_point,baseplate.Ta)
+
+def case_temperature(index,max_point,baseplate,T):
+    return baseplate.transistor_array[index].estimate_case_temperature(T,baseplate.nump,max_point) + baseplate.Ta
+
+def run_chunk(builder,evaluate,update,num_mirror_sources,solver,params):
+    # Points of one chunk are solved in order on one baseplate. With an update function the
+    # baseplate is built once and then modified, so incremental solves and caches carry over.
+    baseplate = None
+    results = []
+    tm = telemetry.active
+    for param in params:
+        tm.log(telemetry.INFO,"=========================================================================================")
+        tm.log(telemetry.INFO,"Sweep point: %s",param)
+        tm.log(telemetry.INFO,"=========================================================================================")
+
+        if baseplate is None or update is None:
+            baseplate = builder(param)
+            if solver is not None:
+                baseplate.solver = solver
+        else:
+            update(baseplate,param)
+
+        T = baseplate.calculate_temperature_matrix(num_mirror_sources)
+        results.append(evaluate(baseplate,T))
+        tm.progress("sweep",len(results),len(params))
+    return results
+
+def run_sweep(builder,grid,num_mirror_sources,evaluate=junction_temperatures,update=None,workers=1,solver=None):
+    # builder(param) returns a Baseplate for one grid point, update(baseplate,param) optionally moves
+    # an existing one to the next point and evaluate(baseplate,T) extracts the result of a point.
+    # solver overrides Baseplate.solver, "footprint" when only footprint temperatures are evaluated.
+    # All functions have to be picklable (module level functions or functools.partial of them)
+    # when workers > 1. Results are returned in grid order.
+    grid = list(grid)
+    workers = os.cpu_count() if workers is None else workers
+    workers = max(1, min(workers, len(grid)))
+    task = partial(run_chunk,builder,evaluate,update,num_mirror_sources,solver)
+
+    if workers == 1:
+        return task(grid)
+
+    # contiguous chunks when points build on each other, single points otherwise
+    if update is None:
+        chunks = [[param] for param in grid]
+    else:
+        bounds = [len(grid)*i//workers for i in range(workers+1)]
+        chunks = [grid[bounds[i]:bounds[i+1]] for i in range(workers)]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return [result for chunk in pool.map(task,chunks) for result in chunk]
@@ -0,0 +1,91 @@
+import json
+import threading
+import time
+
+# verbosity levels
+SILENT = 0
+INFO   = 1      # sweep points and per transistor solves
+DEBUG  = 2      # every plate / mirror source term
+TRACE  = 3      # progress inside the point-by-point loops
+
+class NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_STAGE = NullStage()
+
+class Stage:
+    __slots__ = ("telemetry","name","start")
+
+    def __init__(self,telemetry,name):
+        self.telemetry = telemetry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.telemetry.record(self.name,time.perf_counter() - self.start)
+        return False
+
+class Telemetry:
+    # Messages go to sink when their level is at most the verbosity level. Stage timings are only
+    # taken when timing is enabled, otherwise stage() hands out a shared no-op context manager.
+    # on_progress(name,done,total) is called for loops that report their progress.
+
+    def __init__(self,level=INFO,sink=print,timing=False,on_progress=None):
+        self.level = level
+        self.sink = sink
+        self.timing = timing
+        self.on_progress = on_progress
+        self.timings = {}
+        self.lock = threading.Lock()         # stages may be timed from several threads
+
+    def enabled(self,level):
+        return level <= self.level
+
+    def log(self,level,message,*args):
+        # message is only formatted with args when it is going to be emitted
+        if level <= self.level:
+            self.sink(message % args if args else message)
+
+    def progress(self,name,done,total):
+        if self.on_progress is not None:
+            self.on_progress(name,done,total)
+
+    def stage(self,name):
+        if not self.timing:
+            return NULL_STAGE
+        return Stage(self,name)
+
+    def record(self,name,seconds):
+        with self.lock:
+            entry = self.timings.get(name)
+            if entry is None:
+                self.timings[name] = [1,seconds,seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                entry[2] = max(entry[2],seconds)
+
+    def report(self):
+        return {name: {"count": count, "total_s": total, "mean_s": total/count, "max_s": longest}
+                for name,(count,total,longest) in self.timings.items()}
+
+    def dump_json(self,path):
+        with open(path,"w") as f:
+            json.dump(self.report(),f,indent=2)
+
+    def reset(self):
+        self.timings = {}
+
+active = Telemetry()
+
+def configure(level=INFO,sink=print,timing=False,on_progress=None):
+    global active
+    active = Telemetry(level,sink,timing,on_progress)
+    return active
@@ -0,0 +1,92 @@
+import numpy as np
+
+import telemetry
+
+def stages(tau):
+    # time constant in s or Foster stages [(weight, tau), ...] with weights summing to 1
+    if np.ndim(tau) == 0:
+        return [(1.0,float(tau))]
+    return [(float(weight),float(t)) for weight,t in tau]
+
+def piecewise_profile(segments,dt):
+    # power history (steps, N) from [(duration in s, powers), ...], every power held for its duration
+    rows = []
+    for duration,powers in segments:
+        rows.append(np.tile(np.asarray(powers,dtype=float),(int(round(duration/dt)),1)))
+    return np.concatenate(rows)
+
+class TransientModel:
+    # Junction temperatures under power histories from the steady-state coupling of a fixed
+    # placement. The case rise of device i follows R[i,j] P_j through first order lags (Foster
+    # stages) with the case time constants, the junction-case rise Rth_i P_i through those of the
+    # junction. Powers are held constant over every time step of length dt (zero order hold), for
+    # which the lags are integrated exactly: per stage x <- a x + (1-a) w u with a = exp(-dt/tau).
+    # A constant power history converges to ThermalCoupling.junction_temperature for the average
+    # rule; for the max rule R is coupling.linear_matrix(True, powers), exact for those powers.
+
+    def __init__(self,coupling,tau_case,tau_junction,max_point=True,powers=None):
+        self.R = coupling.linear_matrix(max_point,powers)
+        self.Rth = coupling.Rth
+        self.Ta = coupling.Ta
+        self.case_stages = stages(tau_case)
+        self.junction_stages = stages(tau_junction)
+
+    def inputs(self,P):
+        # steady case and junction-case rise for every step, each (steps, N)
+        P = np.atleast_2d(np.asarray(P,dtype=float))
+        return P @ self.R.T, P*self.Rth
+
+    def impulse_response(self,stage_list,steps,dt):
+        # rise at the end of step n for a unit input held during step 0
+        n = np.arange(steps)
+        h = np.zeros(steps)
+        for weight,tau in stage_list:
+            a = np.exp(-dt/tau)
+            h += weight*(1-a)*a**n
+        return h
+
+    def simulate(self,P,dt,initial=None,method="recursive"):
+        # Junction temperatures (steps, N) at the end of every step of the power history P (steps, N).
+        # initial: None starts at ambient, "steady" in the steady state of the first powers.
+        # method: "recursive" steps the stage states, "fft" convolves with the impulse responses.
+        Q,J = self.inputs(P)
+        steps = Q.shape[0]
+
+        tm = telemetry.active
+        with tm.stage("transient"):
+            if method == "recursive":
+                T = self.filter(Q,self.case_stages,dt,initial) + self.filter(J,self.junction_stages,dt,initial)
+            elif method == "fft":
+                T = self.convolve(Q,self.case_stages,dt,initial) + self.convolve(J,self.junction_stages,dt,initial)
+            else:
+                raise ValueError("Unknown transient method " + str(method))
+        tm.log(telemetry.INFO,"Transient of %d devices over %d steps of %g s",Q.shape[1],steps,dt)
+        return T + self.Ta
+
+    def filter(self,U,stage_list,dt,initial):
+        T = np.zeros_like(U)
+        for weight,tau in stage_list:
+            a = np.exp(-dt/tau)
+            x = weight*U[0] if initial == "steady" else np.zeros(U.shape[1])
+            u = (1-a)*weight*U
+            for n in range(U.shape[0]):
+                x = a*x + u[n]
+                T[n] += x
+        return T
+
+    def convolve(self,U,stage_list,dt,initial):
+        steps = U.shape[0]
+        h = self.impulse_response(stage_list,steps,dt)
+        size = 2*steps
+        T = np.fft.irfft(np.fft.rfft(U,size,axis=0)*np.fft.rfft(h,size)[:,None],size,axis=0)[:steps]
+        if initial == "steady":
+            n = np.arange(1,steps+1)
+            T += U[0]*sum(weight*np.exp(-n*dt/tau) for weight,tau in stage_list)[:,None]
+        return T
+
+    def step_response(self,steps,dt):
+        # junction temperature rise (steps, N, N) of every device for 1 W switched on in device j at t = 0
+        n = np.arange(1,steps+1)
+        case = sum(weight*(1-np.exp(-n*dt/tau)) for weight,tau in self.case_stages)
+        junction = sum(weight*(1-np.exp(-n*dt/tau)) for weight,tau in self.junction_stages)
+        return case[:,None,None]*self.R + junction[:,None,None]*np.diag(self.Rth)
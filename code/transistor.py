@@ -1,14 +1,30 @@
 import numpy as np
-from matplotlib.patches import Rectangle
+
+import telemetry
+
+# default package
+WIDTH  = 4.1             # Width in mm
+LENGTH = 9.5             # Length in mm
+RTH    = 4.8
+
+def moving_sum(a,width,axis):
+    # sum of `width` consecutive entries along axis, result is width-1 shorter than a
+    a = np.moveaxis(a,axis,0)
+    n = a.shape[0] - width + 1
+    s = a[0:n].copy()
+    for i in range(1,width):
+        s += a[i:i+n]
+    return np.moveaxis(s,0,axis)
 
 class Transistor:
     def __init__(self,power,x0,z0):
         self.power  = power      # Dissipated power in W
-        self.width  = 4.1        # Width in mm
-        self.length = 9.5        # Length in mm
-        self.Rth = 4.8
+        self.width  = WIDTH      # Width in mm
+        self.length = LENGTH     # Length in mm
+        self.Rth = RTH
 
         self.accurate = True
+        self.vectorized = True   # use the NumPy array kernels instead of the point-by-point loops
 
         self.x0 = x0             # center coordinates
         self.z0 = z0
@@ -18,11 +34,12 @@ class Transistor:
         self.z0 = z0
 
     def plot_base_xy(self, ax):
+        from matplotlib.patches import Rectangle
         ax.add_patch(Rectangle((self.z0-self.length*0.5,self.x0-self.width*0.5),self.length,self.width,color="grey"))
 
     def calc_mirror_source_contribution(self,nump,view_x,view_z,k,thickness,ms_num):
 
-        print("  - Adding contribution from mirror source " + str(ms_num))
+        telemetry.active.log(telemetry.DEBUG,"  - Adding contribution from mirror source %d",ms_num)
 
         np_x = int(view_x*nump)            # nump = number of points pr um
         np_z = int(view_z*nump)
@@ -32,42 +49,74 @@ class Transistor:
 
         return self.add_mirror_plate_contribution(T,np_x,np_z,k,yds,nump,ms_num)
 
-    def add_mirror_source_point_contribution(self,T,np_x,np_z,k,yds,pwr,nump):
+    def add_mirror_source_point_contribution(self,T,np_x,np_z,k,yds,pwr,nump,xs=None,zs=None):
+        xs = self.x0 if xs is None else xs     # source position, defaults to the transistor center
+        zs = self.z0 if zs is None else zs
         for x in range(np_x):
-            xds = ((x/nump - self.x0)*(10**-3))**2
+            xds = ((x/nump - xs)*(10**-3))**2
             for z in range(np_z):
-                zds = ((z/nump-self.z0)*(10**-3))**2
+                zds = ((z/nump - zs)*(10**-3))**2
                 T[x][z] += pwr / (2*np.pi*k*np.sqrt(xds + zds + yds))
         return T
 
     def add_mirror_plate_contribution(self,T,np_x,np_z,k,yds,nump,ms_num):
         if self.accurate:
+            if self.vectorized:
+                return T + self.mirror_field(nump,0,np_x,0,np_z,k,yds,ms_num)
             return self.add_mirror_plate_contribution_accurate(T,np_x,np_z,k,yds,nump,ms_num)
         else:
             return self.add_mirror_plate_contribution_fast(T, np_x, np_z, k, yds, nump, ms_num)
 
     def add_mirror_plate_contribution_accurate(self,T,np_x,np_z,k,yds,nump,ms_num):
-        Xln = int((self.x0 - self.width * 0.5)*nump)
-        Xun = int((self.x0 + self.width * 0.5)*nump)
-        Zln = int((self.z0 - self.length * 0.5)*nump)
-        Zun = int((self.z0 + self.length * 0.5)*nump)
+        Xln,Xun,Zln,Zun = self.footprint_indices(nump)
 
         pwr = self.power/(((Xun-Xln)*(Zun-Zln))*(-1)**ms_num)
 
+        tm = telemetry.active
         for xt in range(Xln,Xun,1):
-            print("    * Row " + str(xt-Xln+1) + " of " + str(Xun-Xln))
+            tm.log(telemetry.TRACE,"    * Row %d of %d",xt-Xln+1,Xun-Xln)
+            tm.progress("mirror_rows",xt-Xln+1,Xun-Xln)
             for zt in range(Zln,Zun,1):
-                T = self.add_mirror_source_point_contribution(T,np_x,np_z,k,yds,pwr,nump)
+                T = self.add_mirror_source_point_contribution(T,np_x,np_z,k,yds,pwr,nump,xt/nump,zt/nump)
 
         return T
 
     def add_mirror_plate_contribution_fast(self,T,np_x,np_z,k,yds,nump,ms_num):
+        if self.vectorized:
+            return T + self.point_field(nump,0,np_x,0,np_z,k,yds,self.power,self.x0,self.z0)
         return self.add_mirror_source_point_contribution(T,np_x,np_z,k,yds,self.power,nump)
 
+    def point_field(self,nump,x_start,x_stop,z_start,z_stop,k,yds,pwr,xs,zs):
+        xds = (((np.arange(x_start,x_stop)/nump - xs)*(10**-3))**2)[:,None]
+        zds = (((np.arange(z_start,z_stop)/nump - zs)*(10**-3))**2)[None,:]
+        return pwr / (2*np.pi*k*np.sqrt(xds + zds + yds))
+
+    def mirror_field(self,nump,x_start,x_stop,z_start,z_stop,k,yds,ms_num):
+        # Batched version of add_mirror_plate_contribution_accurate. The sub-sources sit on the
+        # same lattice as the grid, so the point kernel only depends on the integer offset between
+        # grid point and sub-source. It is evaluated once over all offsets that occur and the sum
+        # over the footprint becomes a moving sum along x followed by one along z.
+        Xln,Xun,Zln,Zun = self.footprint_indices(nump)
+
+        pwr = self.power/(((Xun-Xln)*(Zun-Zln))*(-1)**ms_num)
+
+        dx = np.arange(x_start-Xun+1, x_stop-Xln)/nump
+        dz = np.arange(z_start-Zun+1, z_stop-Zln)/nump
+        K = pwr / (2*np.pi*k*np.sqrt(((dx*(10**-3))**2)[:,None] + ((dz*(10**-3))**2)[None,:] + yds))
+
+        K = moving_sum(K,Xun-Xln,0)
+        return moving_sum(K,Zun-Zln,1)
+
     def calc_plate_contribution(self,nump,view_x,view_z,k):
 
-        print("  - Calculating contribution from transistor plate")
+        telemetry.active.log(telemetry.DEBUG,"  - Calculating contribution from transistor plate")
+
+        if self.vectorized:
+            return self.calc_plate_contribution_vectorized(nump,view_x,view_z,k)
+        else:
+            return self.calc_plate_contribution_loop(nump,view_x,view_z,k)
 
+    def calc_plate_contribution_loop(self,nump,view_x,view_z,k):
         np_x = int(view_x*nump)            # nump = number of points pr um
         np_z = int(view_z*nump)
 
@@ -94,27 +143,80 @@ class Transistor:
 
         return T
 
+    def calc_plate_contribution_vectorized(self,nump,view_x,view_z,k):
+        np_x = int(view_x*nump)
+        np_z = int(view_z*nump)
+
+        return self.plate_field(nump,0,np_x,0,np_z,k)
+
+    def plate_field(self,nump,x_start,x_stop,z_start,z_stop,k):
+        # Same closed-form solution as calc_plate_contribution_loop, evaluated on the grid
+        # points [x_start,x_stop) x [z_start,z_stop) in one broadcast
+        x = np.arange(x_start,x_stop)/nump
+        z = np.arange(z_start,z_stop)/nump
+
+        A1 = (x - self.x0 - self.width*0.5)*(10**-3)
+        A2 = (x - self.x0 + self.width*0.5)*(10**-3)
+        B1 = (z - self.z0 - self.length*0.5)*(10**-3)
+        B2 = (z - self.z0 + self.length*0.5)*(10**-3)
+
+        A1 = np.where(A1 == 0, 0.000000001, A1)[:,None]
+        A2 = np.where(A2 == 0, 0.000000001, A2)[:,None]
+        B1 = np.where(B1 == 0, 0.000000001, B1)[None,:]
+        B2 = np.where(B2 == 0, 0.000000001, B2)[None,:]
+
+        c1 = A2*(np.arcsinh(B2/np.abs(A2))-np.arcsinh(B1/np.abs(A2)))
+        c2 = A1*(np.arcsinh(B2/np.abs(A1))-np.arcsinh(B1/np.abs(A1)))
+        c3 = B2*(np.arcsinh(A2/np.abs(B2))-np.arcsinh(A1/np.abs(B2)))
+        c4 = B1*(np.arcsinh(A2/np.abs(B1))-np.arcsinh(A1/np.abs(B1)))
+
+        return (self.power/(2*np.pi*k*self.length*self.width*k*(10**-9)))*(c1-c2+c3-c4)
+
     def calc_contribution(self, nump,view_x,view_z,k,thickness,num_mirror_sources):
-        T = self.calc_plate_contribution(nump,view_x,view_z,k)
+        tm = telemetry.active
+        with tm.stage("direct"):
+            T = self.calc_plate_contribution(nump,view_x,view_z,k)
         if num_mirror_sources > 0:
             for ms in range(1,num_mirror_sources+1):
-                T += self.calc_mirror_source_contribution(nump,view_x,view_z,k,thickness,ms)
+                with tm.stage("mirror_%d" % ms):
+                    T += self.calc_mirror_source_contribution(nump,view_x,view_z,k,thickness,ms)
 
         return T
 
-    def estimate_case_temperature(self,T,nump,max_point):
-
-        # find edges of transistor
+    def footprint_indices(self,nump):
         x_low   = int((self.x0 - self.width*0.5)*nump)
         x_up    = int((self.x0 + self.width*0.5)*nump)
         z_low   = int((self.z0 - self.length*0.5)*nump)
         z_up    = int((self.z0 + self.length*0.5)*nump)
-        T_local = T[x_low:x_up, z_low:z_up]
+        return x_low,x_up,z_low,z_up
+
+    def calc_field(self,nump,x_start,x_stop,z_start,z_stop,k,thickness,num_mirror_sources):
+        # Full contribution (plate + mirror sources) on the grid points [x_start,x_stop) x [z_start,z_stop)
+        tm = telemetry.active
+        with tm.stage("direct"):
+            T = self.plate_field(nump,x_start,x_stop,z_start,z_stop,k)
+        for ms in range(1,num_mirror_sources+1):
+            with tm.stage("mirror_%d" % ms):
+                T += self.mirror_order_field(nump,x_start,x_stop,z_start,z_stop,k,thickness,ms)
+        return T
 
-        if (max_point):
-            return np.max(T_local)
-        else:
-            return np.average(T_local)
+    def mirror_order_field(self,nump,x_start,x_stop,z_start,z_stop,k,thickness,ms_num):
+        yds = ((thickness*2*ms_num)*(10**-3))**2
+        if self.accurate:
+            return self.mirror_field(nump,x_start,x_stop,z_start,z_stop,k,yds,ms_num)
+        return self.point_field(nump,x_start,x_stop,z_start,z_stop,k,yds,self.power,self.x0,self.z0)
+
+    def estimate_case_temperature(self,T,nump,max_point):
+
+        # find edges of transistor
+        with telemetry.active.stage("case_temperature"):
+            x_low,x_up,z_low,z_up = self.footprint_indices(nump)
+            T_local = T[x_low:x_up, z_low:z_up]
+
+            if (max_point):
+                return np.max(T_local)
+            else:
+                return np.average(T_local)
 
     def estimate_junction_temperature(self,T,nump,max_point,Ta):
         return self.estimate_case_temperature(T,nump,max_point) + Ta + self.Rth*self.power